@@ -0,0 +1,84 @@
+import logging
+import os
+import threading
+import Queue
+import h5py
+import numpy as np
+from chainer import serializers
+
+
+def snapshot(obj):
+    # copies all parameters and states of obj into a flat dict of numpy arrays
+    serializer = serializers.DictionarySerializer()
+    serializer.save(obj)
+    return dict((key, np.array(value)) for key, value in serializer.target.items())
+
+
+def write_hdf5(filename, target, compression=4):
+    # same layout as serializers.save_hdf5, written to a temporary file and renamed
+    temp = filename + '.tmp'
+    with h5py.File(temp, 'w') as f:
+        for key, value in target.items():
+            f.create_dataset(key, data=value, compression=None if value.size <= 1 else compression)
+    os.rename(temp, filename)
+
+
+class Checkpointer(object):
+    # snapshots model and optimizer into memory and writes {prefix}_{count:03d}.model/.state
+    # on a background thread. Unless keep_last is 0, only the last keep_last checkpoints
+    # and the keep_best checkpoints with the highest score are kept.
+    # lock, if given, is held while taking snapshots; the learner holds it while updating.
+    def __init__(self, prefix, keep_last=0, keep_best=0, lock=None):
+        self.prefix = prefix
+        self.keep_last = keep_last
+        self.keep_best = keep_best
+        self.lock = lock if lock is not None else threading.Lock()
+        self.saved = []
+        self.queue = Queue.Queue(maxsize=2)
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def paths(self, count):
+        base = '{0}_{1:03d}'.format(self.prefix, count)
+        return base + '.model', base + '.state'
+
+    def save(self, count, model, optimizer, score=None):
+        with self.lock:
+            model_target = snapshot(model)
+            optimizer_target = snapshot(optimizer)
+        self.queue.put((count, score, model_target, optimizer_target))
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            count, score, model_target, optimizer_target = item
+            model_path, state_path = self.paths(count)
+            try:
+                write_hdf5(model_path, model_target)
+                write_hdf5(state_path, optimizer_target)
+            except (IOError, OSError) as e:
+                logging.error('failed to save {}: {}'.format(model_path, e))
+                continue
+            self.saved.append((count, score))
+            self._apply_retention()
+
+    def _apply_retention(self):
+        if self.keep_last <= 0:
+            return
+        keep = set(count for count, score in self.saved[-self.keep_last:])
+        scored = [(score, count) for count, score in self.saved if score is not None]
+        keep.update(count for score, count in sorted(scored, reverse=True)[:self.keep_best])
+        for count, score in self.saved:
+            if count in keep:
+                continue
+            for path in self.paths(count):
+                if os.path.exists(path):
+                    os.remove(path)
+        self.saved = [(count, score) for count, score in self.saved if count in keep]
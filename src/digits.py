@@ -0,0 +1,102 @@
+import numpy as np
+from PIL import Image
+import matcher
+
+
+class DigitReader(object):
+    # reads numbers in a fixed font from screen crops without OCR.
+    # A crop is binarized, split into glyphs at empty columns and each glyph is
+    # matched against templates of digits. Glyphs of touching digits are split by
+    # matching templates from the left.
+    # Templates are learned from fallback(image) -> text, e.g. tesseract, the first
+    # time a glyph is seen; fallback is only called for crops with unknown glyphs.
+    # Results are memoized by the binarized crop.
+    def __init__(self, threshold=170, fallback=None, max_distance=0, cache_size=4096):
+        self.threshold = threshold
+        self.fallback = fallback
+        self.max_distance = max_distance
+        self.cache_size = cache_size
+        self.templates = {}
+        self.glyphs = []
+        self.cache = {}
+        self.hits = 0
+        self.fallbacks = 0
+
+    def binarize(self, image):
+        return matcher.grayscale(matcher.to_array(image)) > self.threshold
+
+    def segment(self, binary):
+        # glyphs from left to right as boolean arrays of the full crop height
+        columns = binary.any(axis=0)
+        edges = np.flatnonzero(np.diff(np.concatenate([[False], columns, [False]]).astype(np.int8)))
+        return [binary[:, left:right] for left, right in zip(edges[::2], edges[1::2])]
+
+    def _key(self, glyph):
+        return glyph.shape, np.packbits(glyph).tobytes()
+
+    def classify(self, glyph):
+        # digits of glyph as a string, or None
+        digit = self.templates.get(self._key(glyph))
+        if digit is not None:
+            return digit
+        # nearest template of the same size within max_distance (rate of differing pixels),
+        # for fonts not rendered exactly the same every time
+        best, best_distance = None, self.max_distance * glyph.size
+        for template, digit in self.glyphs:
+            if template.shape == glyph.shape:
+                distance = np.count_nonzero(template != glyph)
+                if distance <= best_distance:
+                    best, best_distance = digit, distance
+        if best is not None:
+            return best
+        return self.split(glyph)
+
+    def split(self, glyph):
+        digits = ''
+        while glyph.shape[1] > 0:
+            for template, digit in self.glyphs:
+                width = template.shape[1]
+                if template.shape[0] == glyph.shape[0] and width < glyph.shape[1] and \
+                        np.array_equal(template, glyph[:, :width]):
+                    break
+            else:
+                digit = self.templates.get(self._key(glyph))
+                return None if digit is None else digits + digit
+            digits += digit
+            glyph = glyph[:, width:]
+            columns = np.flatnonzero(glyph.any(axis=0))
+            if len(columns) == 0:
+                return digits
+            glyph = glyph[:, columns[0]:]
+        return digits
+
+    def learn(self, glyphs, text):
+        if len(glyphs) == len(text) and text.isdigit():
+            for glyph, digit in zip(glyphs, text):
+                key = self._key(glyph)
+                if key not in self.templates:
+                    self.templates[key] = digit
+                    self.glyphs.append((glyph.copy(), digit))
+
+    def read(self, image):
+        # number in image, or None if it cannot be read
+        binary = self.binarize(image)
+        key = (binary.shape, np.packbits(binary).tobytes())
+        if key in self.cache:
+            self.hits += 1
+            return self.cache[key]
+        glyphs = self.segment(binary)
+        digits = [self.classify(glyph) for glyph in glyphs]
+        if len(digits) > 0 and None not in digits:
+            text = ''.join(digits)
+        elif self.fallback is not None:
+            self.fallbacks += 1
+            text = self.fallback(Image.fromarray(np.where(binary, 255, 0).astype(np.uint8))).strip()
+            self.learn(glyphs, text)
+        else:
+            text = ''
+        number = int(text) if text.isdigit() else None
+        if len(self.cache) >= self.cache_size:
+            self.cache.clear()
+        self.cache[key] = number
+        return number
@@ -1,19 +1,45 @@
+import collections
 import os
 import random
-import time
 import numpy as np
 import pyocr
-from PIL import Image, ImageOps
-import pyautogui as ag
+from PIL import Image
+try:
+    import pyautogui as ag
+except Exception:
+    # no display, only SimulatedGame can be played
+    ag = None
 import logging
+import matcher
+from digits import DigitReader
+from input_backend import DesktopInput, RecordingInput
+from ticker import monotonic
+from watcher import RegionWatcher, ScreenChange
 
 
 class Game(object):
+    # (image name, offset x, offset y) of templates to find the game screen on the desktop
+    ANCHORS = []
+    # rate of changed pixels taken as a transition to another screen, and number of
+    # frames without any change after which the state is checked anyway
+    TRANSITION = 0.5
+    STILL_FRAMES = 30
+
     def __init__(self, width, height):
         self.x = 0
         self.y = 0
         self.width = width
         self.height = height
+        self.plan = matcher.DetectionPlan()
+        self.checks = []
+        self.watcher = RegionWatcher(self.plan)
+        self.screen_change = ScreenChange()
+        self.still = 0
+        self.state_check = True
+        self.steps = collections.deque()
+        self.step_time = 0.0
+        # games on one desktop share the backend, see train.py
+        self.input_backend = DesktopInput() if ag is not None else RecordingInput(limit=0)
 
     def set_position(self, x, y):
         self.x = x
@@ -25,12 +51,77 @@ class Game(object):
     def load_images(self, image_dir):
         raise NotImplementedError
 
-    def detect_position(self):
-        raise NotImplementedError
+    def detect_position(self, screen=None, factor=1, hint=None):
+        if hint is not None:
+            position = self.detect_position_at(hint, screen)
+            if position is not None:
+                return position
+        if screen is None:
+            screen = ag.screenshot()
+        screen = matcher.to_array(screen)
+        for name, offset_x, offset_y in self.ANCHORS:
+            if factor > 1:
+                position = matcher.locate_pyramid(screen, self.images[name], factor)
+            else:
+                position = matcher.locate(screen, self.images[name])
+            if position is not None:
+                x = position[0] - offset_x
+                y = position[1] - offset_y
+                self.set_position(x, y)
+                return (x, y)
+        return None
+
+    def detect_position_at(self, origin, screen=None):
+        # checks only whether the game screen is still at origin
+        x, y = origin
+        if screen is None:
+            if x < 0 or y < 0:
+                return None
+            screen = ag.screenshot(region=(x, y, self.width, self.height))
+            left, top = 0, 0
+        else:
+            left, top = x, y
+        screen = matcher.to_array(screen)
+        for name, offset_x, offset_y in self.ANCHORS:
+            if matcher.match_at(screen, matcher.to_array(self.images[name]), left + offset_x, top + offset_y):
+                self.set_position(x, y)
+                return (x, y)
+        return None
 
     def process(self, screen):
         raise NotImplementedError
 
+    def watch_screen(self):
+        # requests a state check when the screen of the plan looks like a transition
+        # or has stood still for STILL_FRAMES
+        change = self.screen_change.update(self.plan.rgb)
+        if change >= self.TRANSITION:
+            self.state_check = True
+        if change > 0:
+            self.still = 0
+        else:
+            self.still += 1
+            if self.still == self.STILL_FRAMES:
+                self.state_check = True
+
+    def start_steps(self, steps):
+        # steps: (delay, function, args...) run by run_steps() in later process calls,
+        # each delay seconds after the previous one, instead of sleeping.
+        # A function of None only waits.
+        if len(self.steps) == 0:
+            self.step_time = monotonic()
+        self.steps.extend(steps)
+
+    def run_steps(self):
+        # runs the steps that are due; True while steps remain
+        now = monotonic()
+        while len(self.steps) > 0 and now >= self.step_time + self.steps[0][0]:
+            step = self.steps.popleft()
+            self.step_time = now
+            if step[1] is not None:
+                step[1](*step[2:])
+        return len(self.steps) > 0
+
     def action_size(self):
         raise NotImplementedError
 
@@ -53,11 +144,9 @@ class Game(object):
             bottom = y + h
         cropped = screen.crop((x, y, right, bottom))
         if blackwhite >= 0:
-            cropped = ImageOps.grayscale(cropped).point(lambda x: 0 if x < blackwhite else 255)
-            image = ImageOps.grayscale(image).point(lambda x: 0 if x < blackwhite else 255)
-            #cropped.save('cropped.png', 'PNG')
-            #image.save('image.png', 'PNG')
-        position = ag.locate(image, cropped)
+            cropped = matcher.binarize(cropped, blackwhite)
+            image = matcher.binarize(image, blackwhite)
+        position = matcher.locate(cropped, image)
         if position != None:
             if center:
                 return (x + position[0] + position[2] / 2, y + position[1] + position[3] / 2)
@@ -68,17 +157,25 @@ class Game(object):
     def find_image_center(self, screen, image, x=0, y=0, w=None, h=None, blackwhite=-1):
         return self.find_image(screen, image, x, y, w, h, center=True, blackwhite=blackwhite)
 
+    def compile_plan(self, checks):
+        # checks: (name, image name, x, y, w, h[, blackwhite])
+        self.checks = checks
+        self.plan = matcher.DetectionPlan()
+        for check in checks:
+            self.plan.add(check[0], self.images[check[1]], *check[2:])
+        self.watcher = RegionWatcher(self.plan)
+
     def move_to(self, x, y):
-        ag.moveTo(x + self.x, y + self.y)
+        self.input_backend.move_to(x + self.x, y + self.y)
 
     def click(self):
-        ag.click()
+        self.input_backend.click()
 
     def mousedown(self):
-        ag.mouseDown()
+        self.input_backend.mouse_down()
 
     def mouseup(self):
-        ag.mouseUp()
+        self.input_backend.mouse_up()
 
 class PoohHomerun(Game):
     STATE_TITLE  = 0
@@ -88,6 +185,7 @@ class PoohHomerun(Game):
     WIDTH        = 600
     HEIGHT       = 450
     ACTIONS      = np.array([[np.float32(i + 260) / WIDTH * 2 - 1, 0, j, 1 - j] for i in range(0, 100, 3) for j in range(2)], dtype=np.float32)
+    ANCHORS      = [('start', 288, 252), ('select_title', 28, 24)]
 
     def __init__(self):
         super(PoohHomerun, self).__init__(self.WIDTH, self.HEIGHT)
@@ -96,43 +194,38 @@ class PoohHomerun(Game):
         self.images = {}
         self.random_prev_pos = 0
         self.random_count = 0
-        self.adjust_state_count = 0
 
     def load_images(self, image_dir):
         for name in ['start', 'stage', 'select_title', 'select', 'end', 'homerun', 'hit', 'foul', 'strike']:
             self.images[name] = Image.open(os.path.join(image_dir, '{}.png'.format(name)))
-
-    def detect_position(self):
-        screen = ag.screenshot()
-        for name, offset_x, offset_y in [('start', 288, 252), ('select_title', 28, 24)]:
-            position = self.find_image(screen, self.images[name])
-            if position != None:
-                x, y = position
-                x -= offset_x
-                y -= offset_y
-                self.set_position(x, y)
-                return (x, y)
-        return None
+        self.compile_plan([
+            ('start', 'start', 270, 240, 60, 40),
+            ('select_title', 'select_title', 10, 16, 60, 40),
+            ('select', 'select', 460, 406, 60, 40),
+            ('end', 'end', 278, 208, 28, 20),
+            ('homerun', 'homerun', 284, 187, 28, 20),
+            ('hit', 'hit', 284, 201, 28, 20),
+            ('foul', 'foul', 284, 207, 28, 20),
+            ('strike', 'strike', 284, 187, 28, 20),
+        ] + [('stage{}'.format(i), 'stage', 70 + i % 4 * 130, 180 + i / 4 * 170, 80, 20) for i in range(8)])
 
     def adjust_state(self, screen):
-        position = self.find_image(screen, self.images['start'], 270, 240, 60, 40)
-        if position != None:
+        name, position = self.plan.first(['start', 'select_title', 'select'])
+        if name == 'start':
             self.state = self.STATE_TITLE
-            return
-        position = self.find_image(screen, self.images['select_title'], 10, 16, 60, 40)
-        if position != None:
+        elif name == 'select_title':
             self.state = self.STATE_SELECT
-            return
-        position = self.find_image(screen, self.images['select'], 460, 406, 60, 40)
-        if position != None:
+        elif name == 'select':
             self.state = self.STATE_RESULT
-            return
 
     def process(self, screen):
-        self.adjust_state_count -= 1
-        if self.adjust_state_count <= 0:
+        self.plan.set_screen(screen)
+        self.watch_screen()
+        if self.run_steps():
+            return (None, False)
+        if self.state_check:
+            self.state_check = False
             self.adjust_state(screen)
-            self.adjust_state_count = 200
 
         if self.state == self.STATE_TITLE:
             return self._process_title(screen)
@@ -175,63 +268,55 @@ class PoohHomerun(Game):
 
     def _process_title(self, screen):
         self.move_to(0, 0)
-        time.sleep(0.1)
-        position = self.find_image_center(screen, self.images['start'], 270, 240, 60, 40)
+        position = self.plan.find_center('start')
         if position != None:
             x, y = position
-            self.move_to(x, y)
-            time.sleep(0.1)
-            self.click()
-            time.sleep(3)
-        position = self.find_image_center(screen, self.images['select_title'], 10, 16, 60, 40)
+            self.start_steps([(0.1, self.move_to, x, y), (0.1, self.click), (3, None)])
+        position = self.plan.find_center('select_title')
         if position != None:
             self.state = self.STATE_SELECT
         return (None, False)
 
     def _process_select(self, screen):
         self.move_to(0, 0)
-        time.sleep(0.1)
         for i in reversed(range(8)):
-            position = self.find_image_center(screen, self.images['stage'], 70 + i % 4 * 130, 180 + i / 4 * 170, 80, 20)
+            position = self.plan.find_center('stage{}'.format(i))
             if position != None and (i == 0 or random.randint(0, 1) == 0):
                 x, y = position
-                self.move_to(x, y + 10)
-                time.sleep(0.1)
-                self.click()
-                time.sleep(2)
+                self.start_steps([(0.1, self.move_to, x, y + 10), (0.1, self.click), (2, None)])
                 break
-        position = self.find_image_center(screen, self.images['select_title'], 10, 16, 60, 40)
+        position = self.plan.find_center('select_title')
         if position == None:
             self.state = self.STATE_PLAY
             return (None, False)
         return (None, False)
 
     def _process_play(self, screen):
-        position = self.find_image_center(screen, self.images['end'], 278, 208, 28, 20)
+        position = self.plan.find_center('end')
         if position != None:
             self.mouseup()
             self.pausing_play = False
             self.state = self.STATE_RESULT
             return 0, True
-        position = self.find_image_center(screen, self.images['homerun'], 284, 187, 28, 20)
+        position = self.plan.find_center('homerun')
         if position != None:
             if self.pausing_play:
                 return None, False
             self.pausing_play = True
             return 100, True
-        position = self.find_image_center(screen, self.images['hit'], 284, 201, 28, 20)
+        position = self.plan.find_center('hit')
         if position != None:
             if self.pausing_play:
                 return None, False
             self.pausing_play = True
             return -80, True
-        position = self.find_image_center(screen, self.images['foul'], 284, 207, 28, 20)
+        position = self.plan.find_center('foul')
         if position != None:
             if self.pausing_play:
                 return None, False
             self.pausing_play = True
             return -90, True
-        position = self.find_image_center(screen, self.images['strike'], 284, 187, 28, 20)
+        position = self.plan.find_center('strike')
         if position != None:
             if self.pausing_play:
                 return None, False
@@ -243,21 +328,13 @@ class PoohHomerun(Game):
 
     def _process_result(self, screen):
         self.move_to(0, 0)
-        time.sleep(0.1)
-        position = self.find_image_center(screen, self.images['select'], 460, 406, 60, 40)
+        position = self.plan.find_center('select')
         if position != None:
             x, y = position
-            self.move_to(x, y)
-            time.sleep(0.1)
-            self.click()
-            time.sleep(3)
         else:
             x, y = 410, 425
-            self.move_to(x, y)
-            time.sleep(0.1)
-            self.click()
-            time.sleep(3)
-        position = self.find_image_center(screen, self.images['select_title'], 10, 16, 60, 40)
+        self.start_steps([(0.1, self.move_to, x, y), (0.1, self.click), (3, None)])
+        position = self.plan.find_center('select_title')
         if position != None:
             self.state = self.STATE_SELECT
         return (None, False)
@@ -275,16 +352,16 @@ class CoinGetter(Game):
     ACTIONS = np.array([(key, pressed_duration) for key in [0, 1, 2, 3, 4] for pressed_duration in [0, 1]],
                        dtype=np.int)
     KEYS = [None, 'up', 'right', 'down', 'left']
+    ANCHORS = [('left_top', 0, 0), ('title', 153, 49)]
 
     def __init__(self):
         super(CoinGetter, self).__init__(self.WIDTH, self.HEIGHT)
         self.state = self.STATE_TITLE
         self.images = {}
         self.random_count = 0
-        self.adjust_state_count = 0
-        self.prev_coin = None
         self.prev_key = None
         self.level = 1
+        self.digits = DigitReader()
 
         tools = pyocr.get_available_tools()
         if len(tools) == 0:
@@ -292,78 +369,67 @@ class CoinGetter(Game):
             return
         # The tools are returned in the recommended order of usage
         self.ocr_tool = tools[0]
+        # only for numbers with glyphs not learned yet
+        self.digits.fallback = self.ocr
 
     def load_images(self, image_dir):
         for name in ['start', 'restart', 'left_top', 'coin', 'title', 'game_over', 'levelup', 'level', 'to_title']:
             self.images[name] = Image.open(os.path.join(image_dir, '{}.png'.format(name)))
-
-    def get_number(self, screen, image, offset, size):
-        def filter(col):
-            if col > 170:
-                return 255
-            else:
-                return 0
-        position = self.find_image(screen, self.images[image])
-        if position is None:
-            return None
-        x, y = position
-        cropped = screen.crop((x + offset[0], y + offset[1],
-                               x + size[0], y + size[1]))
-        cropped = ImageOps.grayscale(cropped).point(filter)
-        txt = self.ocr_tool.image_to_string(
-            cropped,
+        self.compile_plan([
+            ('start', 'start', 213, 382, 138, 44, 100),
+            ('restart', 'restart', 263, 255, 128, 44, 100),
+            ('restart_color', 'restart', 263, 255, 128, 44),
+            ('left_top', 'left_top', 0, 0, 100, 100),
+            ('coin', 'coin', 144, 415, 152, 27),
+            ('to_title', 'to_title', 167, 255, 128, 44, 100),
+            ('level', 'level', 0, 0, None, None),
+        ])
+        # number of coins right of the coin icon
+        self.watcher.add('coin', 0, 0, 60, 20, anchor='coin')
+
+    def ocr(self, image):
+        return self.ocr_tool.image_to_string(
+            image,
             lang="eng",
             builder=pyocr.builders.TextBuilder(tesseract_layout=6)
         )
-        return int(txt)
 
-    def get_coin_image(self, screen):
-        position = self.find_image(screen, self.images['coin'], 144, 415, 152, 27)
+    def get_number(self, screen, image, offset, size):
+        # image: name of a check of the plan, next to the number
+        position = self.watcher.anchor(image)
         if position is None:
             return None
         x, y = position
-        return screen.crop((x, y, x + 60, y + 20))
+        cropped = np.asarray(screen)[y + offset[1]:y + size[1], x + offset[0]:x + size[0]]
+        return self.digits.read(cropped)
 
     def get_level(self, screen):
         return self.get_number(screen, 'level', (15, 0), (60, 20))
 
-    def detect_position(self, screen = None):
-        if screen is None:
-            screen = ag.screenshot()
-        for img, offset in [('left_top', (0, 0)), ('title', (153, 49))]:
-            position = self.find_image(screen, self.images[img])
-            if position is not None:
-                x, y = position
-                ox, oy = offset
-                x -= ox
-                y -= oy
-                self.set_position(x, y)
-                return x, y
-        return None
-
     def adjust_state(self, screen):
-        position = self.find_image(screen, self.images['start'], 213, 382, 138, 44, blackwhite=100)
-        if position is not None:
+        name, position = self.plan.first(['start', 'restart', 'left_top'])
+        if name == 'start':
             logging.debug('adjust to TITLE')
             self.state = self.STATE_TITLE
             return self.state
-        position = self.find_image_center(screen, self.images['restart'], 263, 255, 128, 44, blackwhite=100)
-        if position is not None:
+        if name == 'restart':
             logging.debug('adjust to RESULT')
             self.state = self.STATE_RESULT
             return self.state
-        position = self.find_image(screen, self.images['left_top'], 0, 0, 100, 100)
-        if position is not None:
+        if name == 'left_top':
             logging.debug('adjust to PLAY')
             self.state = self.STATE_PLAY
             return self.state
         return None
 
     def process(self, screen):
-        self.adjust_state_count -= 1
-        if self.adjust_state_count <= 0:
+        self.plan.set_screen(screen)
+        self.watch_screen()
+        if self.run_steps():
+            return None, False
+        if self.state_check:
+            self.state_check = False
             self.adjust_state(screen)
-            self.adjust_state_count = 100
 
         if self.state == self.STATE_TITLE:
             return self._process_title(screen)
@@ -378,7 +444,7 @@ class CoinGetter(Game):
 
     def keyup_all(self):
         for key in self.KEYS[1:]:
-            ag.keyUp(key)
+            self.input_backend.key_up(key)
 
     def play(self, action):
         key, updown = self.ACTIONS[action]
@@ -387,9 +453,12 @@ class CoinGetter(Game):
             return
         logging.debug("ACTION: {}, {}".format(key, "DOWN" if updown == 0 else "UP"))
         if self.prev_key != key and self.prev_key is not None:
-            ag.keyUp(self.prev_key)
+            self.input_backend.key_up(self.prev_key)
         self.prev_key = key
-        ag.keyDown(key) if updown == 0 else ag.keyUp(key)
+        if updown == 0:
+            self.input_backend.key_down(key)
+        else:
+            self.input_backend.key_up(key)
 
     def randomize_action(self, action, random_probability):
         if random.random() < random_probability:
@@ -400,15 +469,13 @@ class CoinGetter(Game):
         logging.info("process: TITLE")
         self.move_to(100, 100)
         self.click()
-        time.sleep(0.1)
-        position = self.find_image_center(screen, self.images['start'], 213, 382, 138, 44, blackwhite=100)
+        position = self.plan.find_center('start')
         if position is not None:
             x, y =  position
-            self.move_to(x, y)
-            time.sleep(0.1)
-            self.click()
-            self.move_to(0, 0)
-        self.adjust_state_count = -1
+            self.start_steps([(0.1, self.move_to, x, y), (0.1, self.click), (0, self.move_to, 0, 0)])
+        else:
+            self.start_steps([(0.1, None)])
+        self.state_check = True
         return None, False
 
     def _process_play(self, screen):
@@ -416,9 +483,9 @@ class CoinGetter(Game):
         #position = self.find_image_center(screen, self.images['game_over'])
         #if position is None:
         #screen.save('screen.png', 'PNG')
-        position = self.find_image_center(screen, self.images['restart'], 263, 255, 128, 44)
+        position = self.plan.find_center('restart_color')
         if position is not None:
-            time.sleep(5)
+            self.start_steps([(5, None)])
             self.state = self.STATE_RESULT
             return -100, True
         #position = self.find_image_center(screen, self.images['levelup'])
@@ -426,31 +493,31 @@ class CoinGetter(Game):
         #    time.sleep(3)
         #    self.state = self.STATE_RESULT
         #    return 1000, True
-        #level = self.get_level(screen)
-        #if level != self.level:
-        #    self.level = level
-        #    return 1000, True
-        coin = self.get_coin_image(screen)
-        termination = (self.prev_coin != coin)
+        # the coin fingerprint is updated on every frame, also on a level up, so that the
+        # next frame is compared with this one
+        termination = self.watcher.changed('coin')
+        level = self.get_level(screen)
+        if level is not None and level != self.level:
+            level_up = level > self.level
+            self.level = level
+            if level_up:
+                return 1000, True
         reward = 100 if termination else -1
-        self.prev_coin = coin
         return reward, termination
 
     def _process_result(self, screen):
         logging.info("process: RESULT")
         self.keyup_all()
+        self.watcher.reset()
         self.move_to(0, 0)
-        time.sleep(0.1)
-        position = self.find_image_center(screen, self.images['to_title'], 167, 255, 128, 44, blackwhite=100)
+        position = self.plan.find_center('to_title')
         #position = self.find_image_center(screen, self.images['restart'], 263, 255, 128, 44, blackwhite=100)
         if position != None:
             x, y = position
-            self.move_to(x, y)
-            time.sleep(0.5)
-            self.click()
-            time.sleep(0.1)
-            self.move_to(0, 0)
-        self.adjust_state_count = -1
+            self.start_steps([(0.1, self.move_to, x, y), (0.5, self.click), (0.1, self.move_to, 0, 0)])
+        else:
+            self.start_steps([(0.1, None)])
+        self.state_check = True
         return None, False
 
 
@@ -475,8 +542,6 @@ if __name__ == '__main__':
         screen = Image.fromarray(np.array(bits).reshape((h, w, 4))[:,:,2::-1])
 
         #print game._process_play(screen)
-        #coin = game.get_coin_image(screen)
-        #coin.save('coin.png', 'PNG')
         #print game._process_title(screen)
         #print game._process_result(screen)
         #print game.adjust_state(screen)
@@ -0,0 +1,143 @@
+import numpy as np
+from chainer import cuda
+
+
+def im2col_index(channel, height, width, kernel, stride):
+    # flat indices into a (channel, height, width) image of the columns of a convolution,
+    # as (channel * kernel * kernel, out_height * out_width) in the order of W.reshape(out, -1)
+    out_height = (height - kernel) // stride + 1
+    out_width = (width - kernel) // stride + 1
+    c, i, j = np.meshgrid(np.arange(channel), np.arange(kernel), np.arange(kernel), indexing='ij')
+    y, x = np.meshgrid(np.arange(out_height) * stride, np.arange(out_width) * stride, indexing='ij')
+    index = (c.reshape(-1, 1) * height + i.reshape(-1, 1) + y.reshape(1, -1)) * width + j.reshape(-1, 1) + x.reshape(1, -1)
+    return index.astype(np.intp), out_height, out_width
+
+
+def sigmoid(x, out):
+    # tanh form as in chainer's lstm
+    np.multiply(x, 0.5, out=out)
+    np.tanh(out, out=out)
+    out *= 0.5
+    out += 0.5
+    return out
+
+
+class QInference(object):
+    # runs Q for action selection with NumPy only, without building a graph.
+    # Weights are copied from a Q by load(), to be called again whenever the Q changes,
+    # into arrays allocated once like all buffers for batches of batch_size. Convolutions gather columns from
+    # zero-padded inputs with index tables computed once. The LSTM state is kept as
+    # arrays and reset, saved and restored by rows like Q's.
+    # lstm_dtype float16 or int8 (scaled per row) rounds the LSTM input weights, the
+    # largest matrix, to that precision when loaded, block rows at a time. They are kept
+    # as float32, so that every call is a float32 product.
+    def __init__(self, q, batch_size=1, lstm_dtype=np.float32, block=256):
+        self.batch_size = batch_size
+        self.lstm_dtype = np.dtype(lstm_dtype)
+        self.block = block
+        channel = q.conv1.W.shape[1]
+        height, width = q.height, q.width
+        self.layers = []
+        for link in [q.conv1, q.conv2, q.conv3]:
+            out_channel, _, kernel, _ = link.W.shape
+            pad = link.pad[0]
+            padded = np.zeros((batch_size, channel, height + pad * 2, width + pad * 2), dtype=np.float32)
+            index, height, width = im2col_index(channel, height + pad * 2, width + pad * 2, kernel, link.stride[0])
+            columns = np.empty((batch_size,) + index.shape, dtype=np.float32)
+            out = np.empty((batch_size, out_channel, index.shape[1]), dtype=np.float32)
+            self.layers.append((padded, pad, index, columns, out, (height, width)))
+            channel = out_channel
+        self.feature = out.reshape(batch_size, -1)
+        self.latent_size = q.latent_size
+        self.lstm_in = np.empty((4 * self.latent_size, batch_size), dtype=np.float32)
+        self.lateral = np.empty((4 * self.latent_size, batch_size), dtype=np.float32)
+        self.temp = np.empty((batch_size, self.latent_size), dtype=np.float32)
+        self.h = np.zeros((batch_size, self.latent_size), dtype=np.float32)
+        self.c = np.zeros((batch_size, self.latent_size), dtype=np.float32)
+        self.scores = np.empty((batch_size, q.q.W.shape[0]), dtype=np.float32)
+        self.weights = [(np.empty((link.W.shape[0], link.W.size // link.W.shape[0]), dtype=np.float32),
+                         np.empty((link.W.shape[0], 1), dtype=np.float32)) for link in [q.conv1, q.conv2, q.conv3]]
+        # rows of the LSTM gates are interleaved as (a, i, f, o) per unit; grouped here by gate
+        self.order = np.arange(4 * self.latent_size).reshape(self.latent_size, 4).T.ravel()
+        self.upward = np.empty(q.lstm.upward.W.shape, dtype=np.float32)
+        self.rounded = np.empty((block, self.upward.shape[1]), dtype=self.lstm_dtype)
+        self.scale = np.empty((block, 1), dtype=np.float32)
+        self.upward_bias = np.empty((self.upward.shape[0], 1), dtype=np.float32)
+        self.lateral_W = np.empty(q.lstm.lateral.W.shape, dtype=np.float32)
+        self.q_W = np.empty(q.q.W.shape[::-1], dtype=np.float32)
+        self.q_b = np.empty(q.q.b.shape, dtype=np.float32)
+        self.load(q)
+
+    def load(self, q):
+        for link, (W, b) in zip([q.conv1, q.conv2, q.conv3], self.weights):
+            W[...] = cuda.to_cpu(link.W.data).reshape(W.shape)
+            b[...] = cuda.to_cpu(link.b.data).reshape(b.shape)
+        np.take(cuda.to_cpu(q.lstm.upward.W.data), self.order, axis=0, out=self.upward)
+        if self.lstm_dtype != np.float32:
+            for start in range(0, self.upward.shape[0], self.block):
+                end = min(start + self.block, self.upward.shape[0])
+                rows = self.upward[start:end]
+                rounded = self.rounded[:end - start]
+                if self.lstm_dtype == np.int8:
+                    # int8 of scale 1/127 of the largest weight of each row
+                    scale = self.scale[:end - start]
+                    np.max(np.abs(rows), axis=1, keepdims=True, out=scale)
+                    scale /= 127
+                    scale[scale == 0] = 1
+                    rows /= scale
+                    np.rint(rows, out=rows)
+                    rounded[...] = rows
+                    np.multiply(rounded, scale, out=rows)
+                else:
+                    rounded[...] = rows
+                    rows[...] = rounded
+        np.take(cuda.to_cpu(q.lstm.upward.b.data), self.order, out=self.upward_bias[:, 0])
+        np.take(cuda.to_cpu(q.lstm.lateral.W.data), self.order, axis=0, out=self.lateral_W)
+        self.q_W[...] = cuda.to_cpu(q.q.W.data).T
+        self.q_b[...] = cuda.to_cpu(q.q.b.data)
+
+    def reset_state(self, index=None):
+        if index is None:
+            self.h[...] = 0
+            self.c[...] = 0
+        else:
+            self.h[index] = 0
+            self.c[index] = 0
+
+    def get_state(self, index):
+        return self.h[index].copy(), self.c[index].copy()
+
+    def set_state(self, index, state):
+        if state is None:
+            self.reset_state(index)
+        else:
+            self.h[index], self.c[index] = state
+
+    def __call__(self, x):
+        # Q values of x of (batch_size, channel, height, width) as a reused array
+        if x.shape[0] != self.batch_size:
+            raise ValueError('batch size must be {}'.format(self.batch_size))
+        for (padded, pad, index, columns, out, out_shape), (W, b) in zip(self.layers, self.weights):
+            height, width = padded.shape[2:]
+            padded[:, :, pad:height - pad, pad:width - pad] = x
+            np.take(padded.reshape(self.batch_size, -1), index, axis=1, out=columns)
+            np.matmul(W, columns, out=out)
+            out += b
+            np.maximum(out, 0, out=out)
+            x = out.reshape(out.shape[:2] + out_shape)
+        np.dot(self.upward, self.feature.T, out=self.lstm_in)
+        L = self.latent_size
+        a = self.lstm_in
+        np.dot(self.lateral_W, self.h.T, out=self.lateral)
+        a += self.lateral
+        a += self.upward_bias
+        np.tanh(a[:L], out=a[:L])
+        sigmoid(a[L:], out=a[L:])
+        np.multiply(a[2 * L:3 * L].T, self.c, out=self.c)
+        np.multiply(a[:L].T, a[L:2 * L].T, out=self.temp)
+        self.c += self.temp
+        np.tanh(self.c, out=self.temp)
+        np.multiply(a[3 * L:].T, self.temp, out=self.h)
+        np.dot(self.h, self.q_W, out=self.scores)
+        self.scores += self.q_b
+        return self.scores
@@ -0,0 +1,98 @@
+import collections
+
+
+class InputBackend(object):
+    # mouse and key events of the games on one desktop. Events that change nothing
+    # are dropped: a move to the current position, pressing a button or key already
+    # down and releasing one already up. State not known yet, e.g. at start, is never
+    # assumed. If batch is True, events are queued and sent by flush() once per tick,
+    # and consecutive moves are merged into the last one; otherwise they are sent
+    # right away.
+    def __init__(self, batch=False):
+        self.batch = batch
+        self.position = None
+        self.button = None
+        self.keys = {}
+        self.queue = []
+        self.requested = 0
+        self.sent = 0
+
+    def _put(self, event):
+        if self.batch and event[0] == 'move' and len(self.queue) > 0 and self.queue[-1][0] == 'move':
+            self.queue[-1] = event
+        else:
+            self.queue.append(event)
+        if not self.batch:
+            self.flush()
+
+    def move_to(self, x, y):
+        self.requested += 1
+        if (x, y) != self.position:
+            self.position = (x, y)
+            self._put(('move', x, y))
+
+    def click(self):
+        self.requested += 1
+        self.button = False
+        self._put(('click',))
+
+    def mouse_down(self):
+        self.requested += 1
+        if self.button is not True:
+            self.button = True
+            self._put(('mouse_down',))
+
+    def mouse_up(self):
+        self.requested += 1
+        if self.button is not False:
+            self.button = False
+            self._put(('mouse_up',))
+
+    def key_down(self, key):
+        self.requested += 1
+        if self.keys.get(key) is not True:
+            self.keys[key] = True
+            self._put(('key_down', key))
+
+    def key_up(self, key):
+        self.requested += 1
+        if self.keys.get(key) is not False:
+            self.keys[key] = False
+            self._put(('key_up', key))
+
+    def flush(self):
+        # sends the queued events in order; returns their number
+        count = len(self.queue)
+        for event in self.queue:
+            self.send(event)
+        del self.queue[:]
+        self.sent += count
+        return count
+
+    def send(self, event):
+        raise NotImplementedError
+
+
+class DesktopInput(InputBackend):
+    # sends events to the desktop with pyautogui
+    FUNCTIONS = {'move': 'moveTo', 'click': 'click', 'mouse_down': 'mouseDown',
+                 'mouse_up': 'mouseUp', 'key_down': 'keyDown', 'key_up': 'keyUp'}
+
+    def __init__(self, batch=False):
+        super(DesktopInput, self).__init__(batch)
+        import pyautogui
+        self.ag = pyautogui
+
+    def send(self, event):
+        getattr(self.ag, self.FUNCTIONS[event[0]])(*event[1:])
+
+
+class RecordingInput(InputBackend):
+    # sends nothing and keeps the last limit events sent (all if None), for running
+    # without a display and for measuring the events games produce
+    def __init__(self, batch=False, limit=None):
+        super(RecordingInput, self).__init__(batch)
+        self.events = collections.deque(maxlen=limit)
+
+    def send(self, event):
+        self.events.append(event)
@@ -0,0 +1,169 @@
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+from PIL import Image
+
+
+def to_array(image):
+    # same pixel values pyautogui.locate compares: alpha channel is dropped
+    if isinstance(image, np.ndarray):
+        return image
+    if getattr(image, 'mode', 'RGB') not in ('L', 'RGB'):
+        image = image.convert('RGB')
+    return np.asarray(image)
+
+
+def _gray_rounding():
+    # newer Pillow rounds its RGB to L conversion, older versions truncate;
+    # green 1 is 0.587 in gray and tells which one is installed
+    probe = Image.fromarray(np.array([[[0, 1, 0]]], dtype=np.uint8))
+    return 0x8000 if probe.convert('L').getpixel((0, 0)) == 1 else 0
+
+GRAY_ROUNDING = _gray_rounding()
+
+
+def grayscale(rgb):
+    # same integer weights and rounding as the installed PIL's RGB to L conversion
+    rgb = rgb.astype(np.uint32)
+    return ((rgb[..., 0] * 19595 + rgb[..., 1] * 38470 + rgb[..., 2] * 7471 + GRAY_ROUNDING) >> 16).astype(np.uint8)
+
+
+def binarize(image, threshold):
+    # templates and screens go through the same conversion, so both sides of a
+    # check are thresholded alike
+    image = to_array(image)
+    if image.ndim == 3:
+        image = grayscale(image[:, :, :3])
+    return image >= threshold
+
+
+def sliding_windows(haystack, height, width):
+    h, w = haystack.shape[:2]
+    shape = (h - height + 1, w - width + 1, height, width) + haystack.shape[2:]
+    strides = haystack.strides[:2] + haystack.strides
+    return as_strided(haystack, shape=shape, strides=strides, writeable=False)
+
+
+def locate_all(haystack, needle):
+    # returns (x, y) of every exact match in row-major order, like pyautogui.locateAll
+    haystack = to_array(haystack)
+    needle = to_array(needle)
+    h, w = haystack.shape[:2]
+    height, width = needle.shape[:2]
+    if height > h or width > w or haystack.shape[2:] != needle.shape[2:]:
+        return np.zeros((0,), dtype=np.intp), np.zeros((0,), dtype=np.intp)
+    if height == h and width == w:
+        if np.array_equal(haystack, needle):
+            return np.zeros((1,), dtype=np.intp), np.zeros((1,), dtype=np.intp)
+        return np.zeros((0,), dtype=np.intp), np.zeros((0,), dtype=np.intp)
+    windows = sliding_windows(haystack, height, width)
+    # narrow candidates down with the top-left pixel, then compare row by row
+    hit = windows[:, :, 0, 0] == needle[0, 0]
+    if hit.ndim == 3:
+        hit = hit.all(axis=2)
+    ys, xs = np.nonzero(hit)
+    for row in range(height):
+        if len(ys) == 0:
+            break
+        same = windows[ys, xs, row] == needle[row]
+        keep = same.reshape((len(ys), -1)).all(axis=1)
+        ys = ys[keep]
+        xs = xs[keep]
+    return xs, ys
+
+
+def match_at(haystack, needle, x, y):
+    height, width = needle.shape[:2]
+    if x < 0 or y < 0 or y + height > haystack.shape[0] or x + width > haystack.shape[1]:
+        return False
+    return np.array_equal(haystack[y:y + height, x:x + width], needle)
+
+
+def locate_pyramid(haystack, needle, factor=4):
+    # coarse-to-fine search. The needle pixels lying on the screen's factor-spaced
+    # grid must show up on the factor-subsampled screen, so every grid phase of the
+    # needle is searched on the small image and only its candidates are checked at
+    # full resolution. Stops at the first phase that gives a verified hit.
+    haystack = to_array(haystack)
+    needle = to_array(needle)
+    coarse = haystack[::factor, ::factor]
+    height, width = needle.shape[:2]
+    for py in range(min(factor, height)):
+        for px in range(min(factor, width)):
+            xs, ys = locate_all(coarse, needle[py::factor, px::factor])
+            hits = [(y, x) for x, y in zip(xs * factor - px, ys * factor - py) if match_at(haystack, needle, x, y)]
+            if len(hits) > 0:
+                y, x = min(hits)
+                return (int(x), int(y), width, height)
+    return None
+
+
+def locate(haystack, needle):
+    needle = to_array(needle)
+    xs, ys = locate_all(haystack, needle)
+    if len(xs) == 0:
+        return None
+    height, width = needle.shape[:2]
+    return (int(xs[0]), int(ys[0]), width, height)
+
+
+class DetectionPlan(object):
+    # fixed (template, ROI, threshold) checks of a game, compiled once.
+    # Thresholded templates are binarized at compile time and the screen is
+    # converted to grayscale once per frame over the area those checks cover.
+    def __init__(self):
+        self.checks = {}
+        self.gray_box = None
+        self.rgb = None
+        self.gray = None
+
+    def add(self, name, image, x=0, y=0, w=None, h=None, blackwhite=-1):
+        right = None if w is None else x + w
+        bottom = None if h is None else y + h
+        if blackwhite >= 0:
+            template = binarize(image, blackwhite)
+            self._extend_gray_box(x, y, right, bottom)
+        else:
+            template = to_array(image)
+        self.checks[name] = (template, x, y, right, bottom, blackwhite)
+
+    def _extend_gray_box(self, x, y, right, bottom):
+        if self.gray_box is None:
+            self.gray_box = (x, y, right, bottom)
+            return
+        left0, top0, right0, bottom0 = self.gray_box
+        right = None if right is None or right0 is None else max(right, right0)
+        bottom = None if bottom is None or bottom0 is None else max(bottom, bottom0)
+        self.gray_box = (min(x, left0), min(y, top0), right, bottom)
+
+    def set_screen(self, screen):
+        self.rgb = to_array(screen)
+        self.gray = None
+
+    def _roi(self, x, y, right, bottom, blackwhite):
+        if blackwhite < 0:
+            return self.rgb[y:bottom, x:right]
+        left0, top0, right0, bottom0 = self.gray_box
+        if self.gray is None:
+            self.gray = grayscale(self.rgb[top0:bottom0, left0:right0, :3])
+        bottom = None if bottom is None else bottom - top0
+        right = None if right is None else right - left0
+        return self.gray[y - top0:bottom, x - left0:right] >= blackwhite
+
+    def find(self, name, center=False):
+        template, x, y, right, bottom, blackwhite = self.checks[name]
+        position = locate(self._roi(x, y, right, bottom, blackwhite), template)
+        if position is None:
+            return None
+        if center:
+            return (x + position[0] + position[2] / 2, y + position[1] + position[3] / 2)
+        return (x + position[0], y + position[1])
+
+    def find_center(self, name):
+        return self.find(name, center=True)
+
+    def first(self, names):
+        for name in names:
+            position = self.find(name)
+            if position is not None:
+                return name, position
+        return None, None
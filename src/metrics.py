@@ -0,0 +1,125 @@
+import bisect
+import json
+import logging
+import time
+
+
+# upper bounds in seconds of histogram buckets: 0.05ms, 0.07ms, 0.1ms, ..., about 52s
+BUCKETS = [0.00005 * 2 ** (i * 0.5) for i in range(41)]
+
+
+class Histogram(object):
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, rate):
+        # upper bound of the bucket where rate of the samples are reached
+        rank = rate * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count > 0:
+                return min(BUCKETS[i], self.max) if i < len(BUCKETS) else self.max
+        return 0.0
+
+    def stats(self):
+        mean = self.total / self.count if self.count > 0 else 0.0
+        return {'count': self.count, 'mean_ms': mean * 1000, 'p50_ms': self.percentile(0.5) * 1000,
+                'p90_ms': self.percentile(0.9) * 1000, 'p99_ms': self.percentile(0.99) * 1000,
+                'max_ms': self.max * 1000}
+
+
+class Timer(object):
+    # context manager adding the wall-clock time of its block to a histogram
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *args):
+        self.histogram.add(time.time() - self.start)
+        return False
+
+
+class NullTimer(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+NULL_TIMER = NullTimer()
+
+
+class Metrics(object):
+    # latency histograms of stages of a loop and counters of events, summarized every
+    # interval seconds to the log and, if stats_file is given, as a JSON line to the file.
+    # Histograms are cleared after each summary; counters are cumulative.
+    # If interval is 0, nothing is recorded and timer() returns a shared no-op timer.
+    def __init__(self, name, interval=0, stats_file=None):
+        self.name = name
+        self.interval = interval
+        self.enabled = interval > 0
+        self.stats_file = stats_file
+        self.histograms = {}
+        self.timers = {}
+        self.counters = {}
+        self.next_report = time.time() + interval
+
+    def timer(self, stage):
+        if not self.enabled:
+            return NULL_TIMER
+        timer = self.timers.get(stage)
+        if timer is None:
+            timer = self.timers[stage] = Timer(self._histogram(stage))
+        return timer
+
+    def _histogram(self, stage):
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms[stage] = Histogram()
+        return histogram
+
+    def record(self, stage, seconds):
+        if self.enabled:
+            self._histogram(stage).add(seconds)
+
+    def count(self, name, value=1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def report(self):
+        # called every iteration; writes a summary when interval has passed
+        if not self.enabled:
+            return
+        now = time.time()
+        if now < self.next_report:
+            return
+        self.next_report = now + self.interval
+        stages = dict((stage, histogram.stats()) for stage, histogram in self.histograms.items())
+        logging.info('{}: {}'.format(self.name, ', '.join('{}={}'.format(name, value)
+                                                          for name, value in sorted(self.counters.items()))))
+        for stage, stats in sorted(stages.items()):
+            logging.info('{}: {:<10} n={count} mean={mean_ms:.2f}ms p50={p50_ms:.2f}ms p90={p90_ms:.2f}ms '
+                         'p99={p99_ms:.2f}ms max={max_ms:.2f}ms'.format(self.name, stage, **stats))
+        if self.stats_file is not None:
+            with open(self.stats_file, 'a') as f:
+                f.write(json.dumps({'name': self.name, 'time': now, 'counters': self.counters,
+                                    'stages': stages}, sort_keys=True) + '\n')
+        for stage in self.histograms:
+            self.histograms[stage] = Histogram()
+            if stage in self.timers:
+                self.timers[stage].histogram = self.histograms[stage]
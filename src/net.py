@@ -29,5 +29,22 @@ class Q(chainer.Chain):
         q = self.q(h4)
         return q
 
-    def reset_state(self):
-        self.lstm.reset_state()
+    def reset_state(self, index=None):
+        # index: rows of the batch to reset, e.g. games among ones played in parallel
+        if index is None:
+            self.lstm.reset_state()
+        elif self.lstm.h is not None:
+            self.lstm.h.data[index] = 0
+            self.lstm.c.data[index] = 0
+
+    def get_state(self, index):
+        # copy of LSTM state of rows index, None before the first call
+        if self.lstm.h is None:
+            return None
+        return self.lstm.h.data[index].copy(), self.lstm.c.data[index].copy()
+
+    def set_state(self, index, state):
+        if state is None:
+            self.reset_state(index)
+        else:
+            self.lstm.h.data[index], self.lstm.c.data[index] = state
@@ -0,0 +1,75 @@
+import threading
+import time
+import Queue
+import numpy as np
+
+
+class BatchPrefetcher(object):
+    # builds upcoming minibatches on a background thread.
+    # sampler(term_size) returns batch_index or None if there are not enough frames yet.
+    # term_size is read from the term_size attribute, which the learner may change.
+    # A batch is read with get_batch() followed by term_size + 1 calls of get_states(),
+    # which return the states of batch_index, batch_index + 1, ..., batch_index + term_size.
+    # States are reusable buffers and must be given back with release() after use.
+    # capacity is the number of states built ahead; 0 builds them on the learner's thread.
+    # Once stopped() is true, get_batch() returns a batch_index of None.
+    def __init__(self, memory, sampler, batch_size, capacity=8, stopped=None):
+        self.memory = memory
+        self.sampler = sampler
+        self.stopped = stopped if stopped is not None else lambda: False
+        self.capacity = capacity
+        self.ready = Queue.Queue(max(capacity, 1))
+        self.free = Queue.Queue()
+        for i in range(max(capacity, 1) + 2):
+            self.free.put(np.empty((batch_size,) + memory.input_shape, dtype=np.float32))
+        self.term_size = 1
+        self.thread = None
+        self.batch_index = None
+        self.term = 0
+
+    def start(self):
+        if self.capacity > 0:
+            self.thread = threading.Thread(target=self._run)
+            self.thread.daemon = True
+            self.thread.start()
+
+    def _run(self):
+        while True:
+            batch_index, term_size = self._sample()
+            self.ready.put((batch_index, term_size))
+            if batch_index is None:
+                return
+            for term in range(term_size + 1):
+                self.ready.put(self._gather(batch_index, term))
+
+    def _sample(self):
+        term_size = self.term_size
+        batch_index = self.sampler(term_size)
+        while batch_index is None:
+            if self.stopped():
+                return None, term_size
+            time.sleep(0.01)
+            term_size = self.term_size
+            batch_index = self.sampler(term_size)
+        return batch_index, term_size
+
+    def _gather(self, batch_index, term):
+        states = self.free.get()
+        return self.memory.get_states(self.memory.advance(batch_index, term), out=states)
+
+    def get_batch(self):
+        if self.thread is not None:
+            return self.ready.get()
+        self.batch_index, term_size = self._sample()
+        self.term = 0
+        return self.batch_index, term_size
+
+    def get_states(self):
+        if self.thread is not None:
+            return self.ready.get()
+        states = self._gather(self.batch_index, self.term)
+        self.term += 1
+        return states
+
+    def release(self, states):
+        self.free.put(states)
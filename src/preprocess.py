@@ -0,0 +1,111 @@
+import numpy as np
+from PIL import Image
+import matcher
+
+
+class Screen(object):
+    # RGB view of a captured frame. The PIL image is only built when a game asks for it.
+    def __init__(self, array, bgra=None):
+        self.array = array
+        self.bgra = bgra
+        self._image = None
+
+    def __array__(self, dtype=None):
+        if dtype is None:
+            return self.array
+        return self.array.astype(dtype)
+
+    @property
+    def image(self):
+        if self._image is None:
+            self._image = Image.fromarray(np.ascontiguousarray(self.array))
+        return self._image
+
+    @property
+    def width(self):
+        return self.array.shape[1]
+
+    @property
+    def height(self):
+        return self.array.shape[0]
+
+    def crop(self, box):
+        return self.image.crop(box)
+
+    def save(self, *args, **kwargs):
+        return self.image.save(*args, **kwargs)
+
+
+class Preprocessor(object):
+    # captured BGRA buffer -> (channels, height / divisor, width / divisor) observation,
+    # averaging each divisor x divisor block. channels is 1 if grayscale, otherwise 3.
+    # All buffers are allocated once; sums are uint16 unless a block of 255s with the
+    # rounding term would overflow it, i.e. divisor > 16.
+    def __init__(self, width, height, divisor=4, grayscale=False):
+        self.width = width
+        self.height = height
+        self.divisor = divisor
+        self.grayscale = grayscale
+        self.channels = 1 if grayscale else 3
+        self.train_width = width // divisor
+        self.train_height = height // divisor
+        sum_dtype = np.uint16 if 255 * divisor * divisor + divisor * divisor // 2 <= np.iinfo(np.uint16).max else np.uint32
+        self.row_sum = np.empty((self.train_height, self.train_width * divisor, 4), dtype=sum_dtype)
+        self.block_sum = np.empty((self.train_height, self.train_width, 4), dtype=sum_dtype)
+        self.gray_sum = np.empty((2, self.train_height, self.train_width), dtype=np.uint32)
+        self.observation = np.empty((self.channels, self.train_height, self.train_width), dtype=np.uint8)
+        self.input = np.empty((1, self.channels, self.train_height, self.train_width), dtype=np.float32)
+
+    def screen(self, bgra):
+        # bgra: any object exporting the buffer protocol, e.g. QImage.bits()
+        array = np.frombuffer(bgra, dtype=np.uint8).reshape((self.height, self.width, 4))
+        return Screen(array[:, :, 2::-1], bgra=array)
+
+    def observe(self, screen):
+        # sums the rows and then the columns of each block with contiguous adds
+        d = self.divisor
+        bgra = getattr(screen, 'bgra', None)
+        if bgra is None:
+            source = np.asarray(screen)
+            channels = range(3)
+        else:
+            source = bgra
+            channels = [2, 1, 0]
+        c = source.shape[2]
+        rows = source[:self.train_height * d, :self.train_width * d].reshape(
+            (self.train_height, d, self.train_width * d, c))
+        row_sum = self.row_sum[:, :, :c]
+        row_sum[...] = rows[:, 0]
+        for i in range(1, d):
+            row_sum += rows[:, i]
+        cols = row_sum.reshape((self.train_height, self.train_width, d, c))
+        block_sum = self.block_sum[:, :, :c]
+        block_sum[...] = cols[:, :, 0]
+        for i in range(1, d):
+            block_sum += cols[:, :, i]
+        block_sum += d * d // 2
+        block_sum //= d * d
+        if self.grayscale:
+            # same weights and rounding as matcher.grayscale, i.e. PIL's RGB to L conversion
+            gray, term = self.gray_sum
+            for i, weight in enumerate([19595, 38470, 7471]):
+                np.multiply(block_sum[:, :, channels[i]], weight, out=term if i > 0 else gray, dtype=np.uint32)
+                if i > 0:
+                    gray += term
+            gray += matcher.GRAY_ROUNDING
+            gray >>= 16
+            self.observation[0] = gray
+            return self.observation
+        for i, channel in enumerate(channels):
+            self.observation[i] = block_sum[:, :, channel]
+        return self.observation
+
+    def normalize(self, observation=None, out=None):
+        # out: (1, channels, train_height, train_width) float32 to write into instead of self.input
+        if observation is None:
+            observation = self.observation
+        if out is None:
+            out = self.input
+        np.multiply(observation, 1 / 127.5, out=out[0], casting='unsafe')
+        out -= 1
+        return out
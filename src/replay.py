@@ -0,0 +1,266 @@
+import multiprocessing
+import threading
+import numpy as np
+
+
+def allocate(shape, dtype, shared=False):
+    # shared arrays live in shared memory and are seen by processes forked afterwards
+    if not shared:
+        return np.zeros(shape, dtype=dtype)
+    nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+    return np.frombuffer(multiprocessing.RawArray('b', nbytes), dtype=dtype).reshape(shape)
+
+
+def discounted_returns(rewards, gamma, chunk=1024):
+    # returns[i] = rewards[i] + gamma * returns[i + 1], computed with cumsum chunk by
+    # chunk from the end so that powers of gamma do not underflow: a chunk is at most
+    # as long as gamma takes to fall to 1e-150
+    if gamma == 0:
+        chunk = 1
+    elif gamma < 1:
+        chunk = max(min(chunk, int(150 / -np.log10(gamma))), 1)
+    returns = np.empty(len(rewards), dtype=np.float64)
+    carry = 0.0
+    for end in range(len(rewards), 0, -chunk):
+        start = max(end - chunk, 0)
+        power = gamma ** np.arange(end - start, dtype=np.float64)
+        tail = np.cumsum((rewards[start:end] * power)[::-1])[::-1] / power
+        returns[start:end] = tail + carry * gamma * power[::-1]
+        carry = returns[start]
+    return returns
+
+
+class ReplayMemory(object):
+    # frames are kept as uint8 and only converted to the [-1, 1] float range
+    # for the sampled minibatch. If filename is given, the frame pool is backed
+    # by a memory-mapped file so that it can be larger than RAM.
+    # If shared is True, all pools are in shared memory for a forked learner process.
+    # The pool is split into lanes, one per game, so that consecutive frames of
+    # a game stay consecutive in its lane.
+    # Each frame of shape is stored once. If stack > 1, states are rebuilt from the
+    # last stack frames of the episode as input_shape, stacked along the first axis.
+    def __init__(self, size, shape, filename=None, shared=False, lanes=1, stack=1):
+        self.size = size
+        self.shape = tuple(shape)
+        self.stack = stack
+        self.input_shape = (self.shape[0] * stack,) + self.shape[1:]
+        self.shared = shared
+        self.lanes = lanes
+        self.lane_size = size // lanes
+        self.counts = allocate((lanes,), np.int64, shared)
+        # count of the first frame of the current episode of each lane
+        self.episode_starts = allocate((lanes,), np.int64, shared)
+        if filename is None:
+            self.states = allocate((size,) + self.shape, np.uint8, shared)
+        else:
+            self.states = np.memmap(filename, dtype=np.uint8, mode='w+', shape=(size,) + self.shape)
+        self.actions = allocate((size,), np.int32, shared)
+        self.rewards = allocate((size,), np.float32, shared)
+        self.terminals = allocate((size,), np.float32, shared)
+
+    def __len__(self):
+        return self.size
+
+    def slot(self, lane, count=None):
+        # index of the count-th frame of lane, the next one to be written by default
+        if count is None:
+            count = self.counts[lane]
+        return lane * self.lane_size + count % self.lane_size
+
+    def advance(self, index, step):
+        # index of the frame step frames after (or before) index in the same lane
+        base = index // self.lane_size * self.lane_size
+        return base + (index - base + step) % self.lane_size
+
+    def commit(self, lane):
+        self.counts[lane] += 1
+
+    def end_episode(self, lane, gamma=None):
+        # the last committed frame of lane ends the episode and the next one starts a new one.
+        # If gamma is given, rewards of the episode still in the pool are replaced by
+        # their discounted returns.
+        end = self.counts[lane]
+        if gamma is not None:
+            start = max(self.episode_starts[lane], end - self.lane_size + 1)
+            index = self.slot(lane, np.arange(start, end))
+            self.rewards[index] = discounted_returns(self.rewards[index], gamma)
+        self.episode_starts[lane] = end
+
+    def n_step_returns(self, index, n, gamma):
+        # discounted sums of rewards of up to n transitions from index, stopping at a terminal,
+        # and discount of the state n transitions ahead (0 after a terminal).
+        # valid is False where the frames needed are not written yet. The reward and terminal
+        # of a frame are written with the next frame, so a step is valid only if the frame
+        # after its last counted transition is written, terminal or not.
+        index = np.asarray(index)
+        steps = self.advance(index[..., None], np.arange(n))
+        rewards = self.rewards[steps]
+        terminals = self.terminals[steps]
+        alive = np.cumprod(1 - terminals, axis=-1)
+        counted = np.concatenate([np.ones(index.shape + (1,), dtype=np.float32), alive[..., :-1]], axis=-1)
+        returns = (rewards * counted * gamma ** np.arange(n)).sum(axis=-1)
+        discount = gamma ** n * alive[..., -1]
+        lane = index // self.lane_size
+        written = (self.slot(lane, self.counts[lane]) - index) % self.lane_size
+        length = np.minimum(counted.sum(axis=-1), n)
+        valid = length < written
+        return returns.astype(np.float32), discount.astype(np.float32), valid
+
+    def complete(self, index, term_size):
+        # whether index is written and followed by term_size transitions written in full,
+        # i.e. frame index + term_size is older than the head of the lane
+        lane = index // self.lane_size
+        written = index - lane * self.lane_size < self.counts[lane]
+        ahead = (self.slot(lane, self.counts[lane]) - index) % self.lane_size
+        return written & (ahead > term_size)
+
+    def sample_uniform(self, batch_size, term_size):
+        # distinct indices followed by term_size complete transitions, uniformly over all lanes.
+        # Offsets count from the oldest frame still in each lane. Once a lane has wrapped, that
+        # is the frame after the head, as the head is the slot overwritten next (see complete).
+        filled = np.minimum(self.counts, self.lane_size - 1)
+        valid = np.clip(filled - term_size, 0, None)
+        end = np.cumsum(valid)
+        offset = np.random.permutation(end[-1])[:batch_size]
+        lane = np.searchsorted(end, offset, side='right')
+        return self.slot(lane, self.counts[lane] - filled[lane] + offset - (end - valid)[lane])
+
+    def put_state(self, index, state):
+        self.states[index % self.size] = state
+
+    def get_frames(self, index):
+        # uint8 states of index as index.shape + input_shape
+        if self.stack == 1:
+            return self.states[index]
+        index = np.asarray(index)
+        frame_index = self.advance(index[..., None], np.arange(1 - self.stack, 1))
+        frames = self.states[frame_index]
+        # a frame belongs to the stack if it was written after the previous frames of
+        # the lane and no terminal lies between it and the last frame
+        lane = index // self.lane_size
+        head = self.slot(lane, self.counts[lane])
+        age = (head[..., None] - 1 - frame_index) % self.lane_size
+        valid = (age >= age[..., -1:]) & (age < np.minimum(self.counts[lane], self.lane_size)[..., None])
+        terminals = self.terminals[frame_index[..., :-1]]
+        valid[..., :-1] &= np.cumsum(terminals[..., ::-1], axis=-1)[..., ::-1] == 0
+        valid = np.logical_and.accumulate(valid[..., ::-1], axis=-1)[..., ::-1]
+        # frames before the episode repeat its first frame
+        for j in range(self.stack - 2, -1, -1):
+            keep = valid[..., j].reshape(valid.shape[:-1] + (1,) * len(self.shape))
+            frames[..., j, :, :, :] = np.where(keep, frames[..., j, :, :, :], frames[..., j + 1, :, :, :])
+        return frames.reshape(index.shape + self.input_shape)
+
+    def get_states(self, index, out=None):
+        return self.normalize(self.get_frames(index), out=out)
+
+    def normalize(self, frames, out=None):
+        if out is None:
+            out = np.empty(frames.shape, dtype=np.float32)
+        np.multiply(frames, 1 / 127.5, out=out, casting='unsafe')
+        out -= 1
+        return out
+
+    def get_windows(self, batch_index, term_size):
+        # states of batch_index, batch_index + 1, ..., batch_index + term_size in one gather,
+        # as uint8 of (batch, term_size + 1) + input_shape.
+        # mask[b, t] is 0 if transition t of window b follows a terminal in the window
+        # or reaches the head of its lane, the slot to be written next.
+        index = self.advance(batch_index[:, None], np.arange(term_size + 1))
+        frames = self.get_frames(index)
+        terminals = self.terminals[index[:, :-1]]
+        ended = np.cumsum(terminals, axis=1) - terminals
+        lane = batch_index // self.lane_size
+        head = self.slot(lane, self.counts[lane])
+        offset = (head - batch_index) % self.lane_size
+        mask = (ended == 0) & (np.arange(1, term_size + 1) < offset[:, None])
+        return frames, index, mask.astype(np.float32)
+
+    def flush(self):
+        # writes the frame pool to its file, if any
+        if isinstance(self.states, np.memmap):
+            self.states.flush()
+
+
+class SumTree(object):
+    # binary tree of priorities where each node holds the sum of its children.
+    # Updates and sampling work on a whole batch of leaves at a time in O(batch log size).
+    def __init__(self, size, shared=False):
+        self.size = size
+        self.leaf = 1
+        while self.leaf < size:
+            self.leaf *= 2
+        self.tree = allocate((self.leaf * 2,), np.float64, shared)
+
+    def total(self):
+        return self.tree[1]
+
+    def get(self, index):
+        return self.tree[self.leaf + index]
+
+    def update(self, index, priority):
+        node = np.asarray(index) % self.size + self.leaf
+        self.tree[node] = priority
+        node = np.unique(node // 2)
+        while node[0] >= 1:
+            self.tree[node] = self.tree[node * 2] + self.tree[node * 2 + 1]
+            node = np.unique(node // 2)
+
+    def find(self, value):
+        # leaf index where the cumulative sum of priorities reaches value
+        value = np.array(value, dtype=np.float64)
+        node = np.ones(value.shape, dtype=np.int64)
+        while node[0] < self.leaf:
+            left = node * 2
+            right = value >= self.tree[left]
+            value -= self.tree[left] * right
+            node = left + right
+        return np.minimum(node - self.leaf, self.size - 1)
+
+
+class PrioritizedReplayMemory(ReplayMemory):
+    # samples transitions in proportion to priority ** alpha, where priority is
+    # the last absolute TD error. New transitions get the maximum priority seen so far.
+    def __init__(self, size, shape, filename=None, shared=False, lanes=1, stack=1, alpha=0.6, epsilon=1e-6):
+        super(PrioritizedReplayMemory, self).__init__(size, shape, filename, shared, lanes, stack)
+        self.alpha = alpha
+        self.epsilon = epsilon
+        self.max_priority = allocate((1,), np.float64, shared)
+        self.max_priority[0] = 1.0
+        self.tree = SumTree(size, shared)
+        self.lock = multiprocessing.Lock() if shared else threading.Lock()
+
+    def set_priority(self, index, priority=None):
+        if priority is None:
+            priority = self.max_priority[0]
+        with self.lock:
+            self.tree.update(np.atleast_1d(index), priority)
+
+    def update_priorities(self, index, td_error):
+        priority = (np.abs(td_error) + self.epsilon) ** self.alpha
+        with self.lock:
+            self.max_priority[0] = max(self.max_priority[0], float(priority.max()))
+            self.tree.update(index, priority)
+
+    def sample(self, batch_size, term_size=0, attempts=10):
+        # stratified: one sample from each of batch_size equal slices of the total priority.
+        # Samples not followed by term_size complete transitions, near the head of their
+        # lane, are drawn again over the whole range; None if some still are after attempts.
+        with self.lock:
+            total = self.tree.total()
+            if total <= 0:
+                return None
+            value = (np.arange(batch_size) + np.random.uniform(size=batch_size)) * (total / batch_size)
+            index = self.tree.find(value)
+            for i in range(attempts):
+                redraw = ~self.complete(index, term_size)
+                if not redraw.any():
+                    return index
+                index[redraw] = self.tree.find(np.random.uniform(0, total, np.count_nonzero(redraw)))
+            return None
+
+    def weights(self, index, beta, count):
+        # importance-sampling weights normalized by the largest one in the batch
+        with self.lock:
+            probability = self.tree.get(index) / self.tree.total()
+        weights = (count * np.maximum(probability, 1e-12)) ** -beta
+        return (weights / weights.max()).astype(np.float32)
@@ -0,0 +1,74 @@
+import logging
+import multiprocessing
+import threading
+import time
+
+
+class LearnerScheduler(object):
+    # lets the learner block until the actor has collected enough frames.
+    # replay_ratio is the target number of updates per collected frame (0 for no limit).
+    # If shared is True, the counters are in shared memory for a forked learner process.
+    # stop() wakes the learner for good when the actor exits.
+    def __init__(self, replay_ratio=0, shared=False):
+        self.replay_ratio = replay_ratio
+        if shared:
+            self.condition = multiprocessing.Condition()
+            self.counters = multiprocessing.RawArray('l', 3)
+        else:
+            self.condition = threading.Condition()
+            self.counters = [0, 0, 0]
+        self.waits = 0
+        self.idle_time = 0.0
+
+    @property
+    def frames(self):
+        return self.counters[0]
+
+    @property
+    def updates(self):
+        return self.counters[1]
+
+    @property
+    def stopped(self):
+        return self.counters[2] != 0
+
+    def stop(self):
+        with self.condition:
+            self.counters[2] = 1
+            self.condition.notify_all()
+
+    def add_frame(self, count=1):
+        with self.condition:
+            self.counters[0] += count
+            self.condition.notify_all()
+
+    def _ready(self, min_frames, updates):
+        if self.frames < min_frames:
+            return False
+        return self.replay_ratio <= 0 or self.updates + updates <= self.replay_ratio * self.frames
+
+    def wait(self, min_frames, updates=1):
+        # blocks until min_frames are collected and updates more updates keep the replay ratio;
+        # False if stopped instead. The updates are counted by reserve() once a batch is drawn.
+        start = time.time()
+        with self.condition:
+            while not self.stopped and not self._ready(min_frames, updates):
+                self.condition.wait()
+            if self.stopped:
+                return False
+        self.idle_time += time.time() - start
+        return True
+
+    def reserve(self, updates=1):
+        with self.condition:
+            self.counters[1] += updates
+            self.waits += 1
+
+    def summary(self):
+        ratio = float(self.updates) / self.frames if self.frames > 0 else 0
+        return 'learner: {} frames, {} updates, {:.3f} updates/frame, idle {:.1f}s'.format(
+            self.frames, self.updates, ratio, self.idle_time)
+
+    def log_summary(self, every=1000):
+        if self.waits % every == 0:
+            logging.info(self.summary())
@@ -0,0 +1,26 @@
+import sys
+
+
+class DesktopSource(object):
+    # captures the region of a game on the desktop with Qt
+    def __init__(self):
+        from PyQt4.QtGui import QPixmap, QApplication
+        self.pixmap = QPixmap
+        self.app = QApplication(sys.argv)
+        self.window_id = self.app.desktop().winId()
+        self.image = None
+
+    def grab(self, game):
+        # BGRA buffer of the game region, valid until the next grab
+        left, top, w, h = game.region()
+        pixmap = self.pixmap.grabWindow(self.window_id, left, top, w, h)
+        self.image = pixmap.toImage()
+        bits = self.image.bits()
+        bits.setsize(self.image.byteCount())
+        return bits
+
+
+class SimulatedSource(object):
+    # frames rendered by games without a desktop, e.g. SimulatedGame
+    def grab(self, game):
+        return game.render()
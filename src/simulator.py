@@ -0,0 +1,92 @@
+import random
+import numpy as np
+from game import Game
+from input_backend import RecordingInput
+
+
+class SimulatedGame(Game):
+    # small synthetic game rendered into a BGRA buffer, for running training without a desktop.
+    # A ball falls from the top and the paddle at the bottom moves left or right;
+    # catching the ball gives 100 and missing it -100. After a miss the game pauses
+    # for PAUSE_FRAMES frames like a result screen.
+    WIDTH         = 600
+    HEIGHT        = 450
+    BALL_SIZE     = 16
+    FALL_SPEED    = 10
+    PADDLE_WIDTH  = 80
+    PADDLE_HEIGHT = 12
+    PADDLE_SPEED  = 20
+    PAUSE_FRAMES  = 10
+    BACKGROUND    = (40, 120, 40)
+    PAUSE_COLOR   = (20, 20, 20)
+    # paddle move: 0=stay, 1=left, 2=right
+    ACTIONS       = np.array([0, -1, 1], dtype=np.int32)
+    KEYS          = {-1: 'left', 1: 'right'}
+
+    def __init__(self, seed=None):
+        super(SimulatedGame, self).__init__(self.WIDTH, self.HEIGHT)
+        self.images = {}
+        self.input_backend = RecordingInput(limit=0)
+        self.random = random.Random(seed)
+        self.frame = np.empty((self.HEIGHT, self.WIDTH, 4), dtype=np.uint8)
+        self.frame[:, :, 3] = 255
+        self.paddle_x = (self.WIDTH - self.PADDLE_WIDTH) // 2
+        self.move = 0
+        self.pause = 0
+        self.result = (None, False)
+        self._new_ball()
+
+    def load_images(self, image_dir):
+        pass
+
+    def detect_position(self, screen=None, factor=1, hint=None):
+        return (self.x, self.y)
+
+    def _new_ball(self):
+        self.ball_x = self.random.randint(0, self.WIDTH - self.BALL_SIZE)
+        self.ball_y = 0
+
+    def step(self):
+        if self.pause > 0:
+            self.pause -= 1
+            if self.pause == 0:
+                self._new_ball()
+            self.result = (None, False)
+            return
+        self.paddle_x = min(max(self.paddle_x + self.move * self.PADDLE_SPEED, 0), self.WIDTH - self.PADDLE_WIDTH)
+        self.ball_y += self.FALL_SPEED
+        if self.ball_y + self.BALL_SIZE < self.HEIGHT - self.PADDLE_HEIGHT:
+            self.result = (0, False)
+        elif self.paddle_x <= self.ball_x + self.BALL_SIZE / 2 < self.paddle_x + self.PADDLE_WIDTH:
+            self.result = (100, True)
+            self._new_ball()
+        else:
+            self.result = (-100, True)
+            self.pause = self.PAUSE_FRAMES
+
+    def render(self):
+        # advances one frame and returns the screen as BGRA of (height, width, 4)
+        self.step()
+        screen = self.frame[:, :, :3]
+        if self.pause > 0:
+            screen[...] = self.PAUSE_COLOR
+            return self.frame
+        screen[...] = self.BACKGROUND
+        screen[self.ball_y:self.ball_y + self.BALL_SIZE, self.ball_x:self.ball_x + self.BALL_SIZE] = 255
+        screen[self.HEIGHT - self.PADDLE_HEIGHT:, self.paddle_x:self.paddle_x + self.PADDLE_WIDTH] = (255, 200, 0)
+        return self.frame
+
+    def process(self, screen):
+        return self.result
+
+    def action_size(self):
+        return len(self.ACTIONS)
+
+    def play(self, action):
+        self.move = self.ACTIONS[action]
+        # the keys a desktop game would be played with, so that input cost is measured too
+        for move, key in self.KEYS.items():
+            if move == self.move:
+                self.input_backend.key_down(key)
+            else:
+                self.input_backend.key_up(key)
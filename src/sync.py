@@ -0,0 +1,86 @@
+import copy
+import logging
+import multiprocessing
+import time
+import numpy as np
+from chainer import cuda
+
+
+def sorted_params(link):
+    return [param for path, param in sorted(link.namedparams())]
+
+
+class SharedParameters(object):
+    # flat copy of a link's parameters in shared memory, used to pass weights
+    # from a forked learner process back to the actor
+    def __init__(self, link):
+        sizes = [param.data.size for param in sorted_params(link)]
+        self.offsets = np.cumsum([0] + sizes)
+        self.buffer = np.frombuffer(multiprocessing.RawArray('f', int(self.offsets[-1])), dtype=np.float32)
+        self.version = multiprocessing.RawValue('l', 0)
+        self.lock = multiprocessing.Lock()
+        self.publish(link)
+
+    def publish(self, link):
+        with self.lock:
+            for i, param in enumerate(sorted_params(link)):
+                self.buffer[self.offsets[i]:self.offsets[i + 1]] = cuda.to_cpu(param.data).ravel()
+            self.version.value += 1
+
+    def load(self, link):
+        with self.lock:
+            for i, param in enumerate(sorted_params(link)):
+                data = self.buffer[self.offsets[i]:self.offsets[i + 1]].reshape(param.data.shape)
+                param.data[...] = cuda.cupy.asarray(data) if isinstance(param.data, cuda.ndarray) else data
+
+
+class ParameterSync(object):
+    # keeps a persistent replica of source and updates its parameters in place.
+    # tau < 1 blends them (Polyak averaging): replica = (1 - tau) * replica + tau * source.
+    # lock, if given, is held while copying; the learner holds it while updating.
+    # If shared (SharedParameters) is given, the replica is loaded from it instead of source.
+    def __init__(self, source, tau=1.0, lock=None, name='sync', shared=None):
+        self.source = source
+        self.replica = copy.deepcopy(source)
+        self.tau = tau
+        self.lock = lock
+        self.name = name
+        self.shared = shared
+        self.pairs = zip(sorted_params(source), sorted_params(self.replica))
+        self.count = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.nbytes = sum(src.data.nbytes for src, dst in self.pairs)
+
+    def sync(self):
+        start = time.time()
+        if self.lock is not None:
+            with self.lock:
+                self._copy()
+        else:
+            self._copy()
+        elapsed = time.time() - start
+        self.count += 1
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+        return self.replica
+
+    def _copy(self):
+        if self.shared is not None:
+            self.shared.load(self.replica)
+            return
+        for src, dst in self.pairs:
+            if self.tau >= 1:
+                dst.data[...] = src.data
+            else:
+                dst.data *= 1 - self.tau
+                dst.data += self.tau * src.data
+
+    def summary(self):
+        mean = self.total_time / self.count if self.count > 0 else 0
+        return '{}: {} syncs, mean {:.2f}ms, max {:.2f}ms, {:.1f}MB copied in place per sync'.format(
+            self.name, self.count, mean * 1000, self.max_time * 1000, self.nbytes / 1e6)
+
+    def log_summary(self, every=100):
+        if self.count % every == 0:
+            logging.info(self.summary())
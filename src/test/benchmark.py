@@ -0,0 +1,249 @@
+import argparse
+import glob
+import json
+import os
+import random
+import sys
+import time
+import numpy as np
+from PIL import Image
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import chainer
+import chainer.functions as F
+from chainer import Variable, optimizers
+from game import PoohHomerun, CoinGetter
+from input_backend import RecordingInput
+from net import Q
+from inference import QInference
+from preprocess import Preprocessor
+from replay import ReplayMemory, PrioritizedReplayMemory
+
+parser = argparse.ArgumentParser(description='Benchmark of hot paths of playing and training on CPU')
+parser.add_argument('--homerun_screens', default=None, type=str,
+                    help='directory of saved screenshots of homerun game screen (png). synthesized if omitted')
+parser.add_argument('--coingetter_screens', default=None, type=str,
+                    help='directory of saved screenshots of coingetter game screen (png). synthesized if omitted')
+parser.add_argument('--repeat', '-n', default=20, type=int,
+                    help='number of measurements of each benchmark')
+parser.add_argument('--pool_sizes', default='1000,10000,50000', type=str,
+                    help='comma separated memory pool sizes for replay sampling')
+parser.add_argument('--widths', default='150,75', type=str,
+                    help='comma separated train widths for Q function')
+parser.add_argument('--latent_sizes', default='256,128', type=str,
+                    help='comma separated latent sizes for Q function')
+parser.add_argument('--only', default=None, type=str,
+                    help='run only benchmarks whose name contains this string')
+parser.add_argument('--output', '-o', default=None, type=str,
+                    help='file to write results as JSON (- for stdout)')
+parser.add_argument('--baseline', '-b', default=None, type=str,
+                    help='JSON results of a previous run to compare with')
+parser.add_argument('--tolerance', default=0.2, type=float,
+                    help='relative slowdown from baseline reported as regression')
+parser.add_argument('--seed', default=0, type=int,
+                    help='random seed of synthesized data')
+
+batch_size = 64
+term_size = 4
+
+
+def measure(func, repeat, number=1):
+    # median and minimum wall-clock time of one call in ms
+    func()
+    times = []
+    for i in range(repeat):
+        start = time.time()
+        for j in range(number):
+            func()
+        times.append((time.time() - start) / number)
+    return {'median_ms': float(np.median(times)) * 1000, 'min_ms': float(np.min(times)) * 1000, 'repeat': repeat}
+
+
+def create_game(name):
+    root = os.path.join(os.path.dirname(__file__), '..', '..')
+    if name == 'coingetter':
+        game = CoinGetter()
+        game.load_images(os.path.join(root, 'image_coingetter'))
+    else:
+        game = PoohHomerun()
+        game.load_images(os.path.join(root, 'image'))
+    game.input_backend = RecordingInput(batch=True, limit=0)
+    return game
+
+
+def load_screens(game, directory, count=8):
+    if directory is not None:
+        return [Image.open(path).convert('RGB') for path in sorted(glob.glob(os.path.join(directory, '*.png')))]
+    # noise with the template of one check pasted in its region per screen
+    screens = []
+    for i in range(count):
+        array = np.random.randint(0, 256, (game.height, game.width, 3)).astype(np.uint8)
+        screen = Image.fromarray(array)
+        check = game.checks[i % len(game.checks)]
+        image = game.images[check[1]].convert('RGB')
+        screen.paste(image, (check[2] + 2, check[3] + 2))
+        screens.append(screen)
+    return screens
+
+
+def to_bgra(screen):
+    rgb = np.asarray(screen.convert('RGB'))
+    bgra = np.empty(rgb.shape[:2] + (4,), dtype=np.uint8)
+    bgra[:, :, 2::-1] = rgb
+    bgra[:, :, 3] = 255
+    return bytearray(bgra.tobytes())
+
+
+def bench_game(name, directory, run, repeat):
+    game = create_game(name)
+    screens = load_screens(game, directory)
+    if len(screens) == 0:
+        print 'no screens in {}'.format(directory)
+        return
+    for check in game.checks:
+        image = game.images[check[1]]
+        blackwhite = check[6] if len(check) > 6 else -1
+        def find_image():
+            for screen in screens:
+                game.find_image(screen, image, *check[2:6], blackwhite=blackwhite)
+        run('{}.find_image.{}'.format(name, check[0]), find_image, len(screens))
+    def process():
+        for screen in screens:
+            # menu steps would skip the detection that is measured
+            game.steps.clear()
+            game.state = game.STATE_PLAY
+            game.process(screen)
+    run('{}.process'.format(name), process, len(screens))
+
+    # actions held for a few ticks each, as the agent plays them
+    actions = np.repeat(np.random.randint(0, game.action_size(), 64), np.random.randint(1, 8, 64))
+    def play():
+        for action in actions:
+            game.play(action)
+            game.input_backend.flush()
+    run('{}.play'.format(name), play, len(actions))
+    backend = game.input_backend
+    if backend.requested > 0:
+        print '{:<48} {} events requested, {} sent'.format(name + '.input', backend.requested, backend.sent)
+
+    preprocessor = Preprocessor(game.width, game.height)
+    frames = [to_bgra(screen) for screen in screens]
+    def preprocess():
+        for bits in frames:
+            preprocessor.observe(preprocessor.screen(bits))
+            preprocessor.normalize()
+    run('{}.preprocess'.format(name), preprocess, len(frames))
+
+
+def bench_replay(pool_sizes, run):
+    shape = (3, 112, 150)
+    for size in pool_sizes:
+        memory = ReplayMemory(size, shape)
+        memory.counts[0] = size * 2
+        def sample_uniform():
+            index = memory.sample_uniform(batch_size, term_size)
+            memory.get_states(memory.advance(index, 1))
+        run('replay.sample_uniform.{}'.format(size), sample_uniform)
+
+        memory = PrioritizedReplayMemory(size, shape)
+        memory.counts[0] = size * 2
+        memory.tree.update(np.arange(size), np.random.uniform(size=size))
+        def sample_prioritized():
+            index = memory.sample(batch_size, term_size)
+            memory.weights(index, 0.4, size)
+            memory.get_states(memory.advance(index, 1))
+            memory.update_priorities(index, np.random.uniform(size=batch_size))
+        run('replay.sample_prioritized.{}'.format(size), sample_prioritized)
+
+
+def bench_q(widths, latent_sizes, run):
+    action_size = PoohHomerun().action_size()
+    for width in widths:
+        height = width * 3 // 4
+        for latent_size in latent_sizes:
+            suffix = 'w{}.l{}'.format(width, latent_size)
+            q = Q(width=width, height=height, latent_size=latent_size, action_size=action_size)
+            x = np.random.uniform(-1, 1, (1, 3, height, width)).astype(np.float32)
+            def forward():
+                q(Variable(x, volatile=True), train=False)
+            q.reset_state()
+            run('q.forward.b1.{}'.format(suffix), forward)
+            for dtype in ['float32', 'int8']:
+                engine = QInference(q, lstm_dtype=dtype)
+                run('q.infer.b1.{}.{}'.format(suffix, dtype), lambda: engine(x))
+
+            optimizer = optimizers.AdaDelta(rho=0.95, eps=1e-06)
+            optimizer.setup(q)
+            optimizer.add_hook(chainer.optimizer.GradientClipping(0.1))
+            x = np.random.uniform(-1, 1, (2, batch_size, 3, height, width)).astype(np.float32)
+            action = np.random.randint(0, action_size, batch_size).astype(np.int32)
+            t = np.random.uniform(-1, 1, batch_size).astype(np.float32)
+            def train():
+                q.reset_state()
+                y = q(Variable(x[0]))
+                q(Variable(x[1]))
+                loss = F.mean_squared_error(F.select_item(y, Variable(action)), Variable(t))
+                optimizer.zero_grads()
+                loss.backward()
+                loss.unchain_backward()
+                optimizer.update()
+            run('q.train.b{}.{}'.format(batch_size, suffix), train)
+
+
+def compare(results, baseline, tolerance):
+    # returns names of benchmarks slower than baseline by more than tolerance
+    regressions = []
+    print
+    print '{:<48} {:>10} {:>10} {:>7}'.format('benchmark', 'baseline', 'current', 'ratio')
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        base = baseline[name]['median_ms']
+        current = results[name]['median_ms']
+        ratio = current / base if base > 0 else float('inf')
+        mark = ''
+        if ratio > 1 + tolerance:
+            mark = ' REGRESSION'
+            regressions.append(name)
+        print '{:<48} {:>8.3f}ms {:>8.3f}ms {:>6.2f}x{}'.format(name, base, current, ratio, mark)
+    return regressions
+
+
+def main():
+    args = parser.parse_args()
+    np.random.seed(args.seed)
+    random.seed(args.seed)
+    results = {}
+
+    def run(name, func, number=1):
+        if args.only is not None and args.only not in name:
+            return
+        # per screen or frame for benchmarks looping over number of them
+        result = measure(func, args.repeat)
+        result['median_ms'] /= number
+        result['min_ms'] /= number
+        results[name] = result
+        print '{:<48} median {:>8.3f}ms  min {:>8.3f}ms'.format(name, result['median_ms'], result['min_ms'])
+        sys.stdout.flush()
+
+    bench_game('homerun', args.homerun_screens, run, args.repeat)
+    bench_game('coingetter', args.coingetter_screens, run, args.repeat)
+    bench_replay([int(v) for v in args.pool_sizes.split(',')], run)
+    bench_q([int(v) for v in args.widths.split(',')], [int(v) for v in args.latent_sizes.split(',')], run)
+
+    document = {'results': results, 'repeat': args.repeat, 'numpy': np.__version__, 'chainer': chainer.__version__}
+    if args.output == '-':
+        print json.dumps(document, indent=2, sort_keys=True)
+    elif args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(document, f, indent=2, sort_keys=True)
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.tolerance)
+        if len(regressions) > 0:
+            print '{} regressions'.format(len(regressions))
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
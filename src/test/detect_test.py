@@ -0,0 +1,50 @@
+import argparse
+import glob
+import os
+import sys
+import time
+from PIL import Image
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from game import PoohHomerun, CoinGetter
+
+parser = argparse.ArgumentParser(description='Time and accuracy of game screen detection on saved desktop screenshots')
+parser.add_argument('--screens', '-s', required=True, type=str,
+                    help='directory of saved desktop screenshots (png)')
+parser.add_argument('--game', default='homerun', type=str,
+                    help='game. homerun or coingetter')
+parser.add_argument('--factor', '-f', default=4, type=int,
+                    help='downsampling factor of coarse search')
+
+
+def main():
+    args = parser.parse_args()
+    game = CoinGetter() if args.game == 'coingetter' else PoohHomerun()
+    image_dir = 'image_coingetter' if args.game == 'coingetter' else 'image'
+    game.load_images(os.path.join(os.path.dirname(__file__), '..', '..', image_dir))
+    elapsed = {'full': 0.0, 'coarse': 0.0, 'hint': 0.0}
+    total = 0
+    mismatch = 0
+    for path in sorted(glob.glob(os.path.join(args.screens, '*.png'))):
+        screen = Image.open(path)
+        start = time.time()
+        expected = game.detect_position(screen)
+        elapsed['full'] += time.time() - start
+        start = time.time()
+        actual = game.detect_position(screen, factor=args.factor)
+        elapsed['coarse'] += time.time() - start
+        start = time.time()
+        hinted = game.detect_position(screen, factor=args.factor, hint=expected)
+        elapsed['hint'] += time.time() - start
+        total += 1
+        if expected != actual or expected != hinted:
+            mismatch += 1
+            print '{}: full={} coarse={} hint={}'.format(os.path.basename(path), expected, actual, hinted)
+    print 'screens: {}, mismatches: {}'.format(total, mismatch)
+    for name in ['full', 'coarse', 'hint']:
+        print '{}: {:.3f}s/screen'.format(name, elapsed[name] / max(total, 1))
+    if mismatch > 0:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+import argparse
+import os
+import sys
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from digits import DigitReader
+
+parser = argparse.ArgumentParser(description='Checks of template learning and fallback of DigitReader on synthetic digits')
+parser.add_argument('--scale', default=2, type=int,
+                    help='pixels per dot of the synthetic font')
+
+# 3x5 dots of each digit
+FONT = {
+    '0': ['###', '#.#', '#.#', '#.#', '###'],
+    '1': ['.#.', '##.', '.#.', '.#.', '###'],
+    '2': ['###', '..#', '###', '#..', '###'],
+    '3': ['###', '..#', '.##', '..#', '###'],
+    '4': ['#.#', '#.#', '###', '..#', '..#'],
+    '5': ['###', '#..', '###', '..#', '###'],
+    '6': ['###', '#..', '###', '#.#', '###'],
+    '7': ['###', '..#', '.#.', '.#.', '.#.'],
+    '8': ['###', '#.#', '###', '#.#', '###'],
+    '9': ['###', '#.#', '###', '..#', '###'],
+}
+
+
+def render(text, scale, gap=1):
+    # RGB crop of text in white on black, gap dots between digits and a dot of margin
+    glyphs = [np.array([[c == '#' for c in row] for row in FONT[digit]]) for digit in text]
+    dots = np.zeros((7, 1 + sum(g.shape[1] + gap for g in glyphs) - gap + 1), dtype=bool)
+    x = 1
+    for glyph in glyphs:
+        dots[1:6, x:x + glyph.shape[1]] = glyph
+        x += glyph.shape[1] + gap
+    gray = np.where(dots, 255, 0).astype(np.uint8).repeat(scale, axis=0).repeat(scale, axis=1)
+    return np.dstack([gray] * 3)
+
+
+class Fallback(object):
+    # OCR stand-in answering text for every crop and counting its calls
+    def __init__(self):
+        self.text = ''
+        self.calls = 0
+
+    def __call__(self, image):
+        self.calls += 1
+        return self.text + '\n'
+
+
+def read(reader, fallback, text, scale, gap=1, answer=None):
+    fallback.text = text if answer is None else answer
+    return reader.read(render(text, scale, gap))
+
+
+def check_learning(scale):
+    fallback = Fallback()
+    reader = DigitReader(fallback=fallback)
+    assert read(reader, fallback, '1234', scale) == 1234 and fallback.calls == 1
+    # known glyphs in another order and the same crop again are read without the fallback
+    assert read(reader, fallback, '4321', scale) == 4321 and fallback.calls == 1
+    assert read(reader, fallback, '1234', scale) == 1234 and reader.hits == 1
+    # an unknown glyph falls back once, then is known
+    assert read(reader, fallback, '15', scale) == 15 and fallback.calls == 2
+    assert read(reader, fallback, '551', scale) == 551 and fallback.calls == 2
+
+
+def check_touching(scale):
+    fallback = Fallback()
+    reader = DigitReader(fallback=fallback)
+    read(reader, fallback, '1207', scale)
+    # digits without a gap are one glyph, split by the templates from the left
+    assert read(reader, fallback, '2017', scale, gap=0) == 2017 and fallback.calls == 1
+
+
+def check_fallback(scale):
+    # without a fallback unknown glyphs are not read
+    reader = DigitReader()
+    assert reader.read(render('42', scale)) is None
+    # an answer not matching the glyphs is returned but not learned
+    fallback = Fallback()
+    reader = DigitReader(fallback=fallback)
+    assert read(reader, fallback, '88', scale, answer='8') == 8
+    assert len(reader.templates) == 0
+    assert read(reader, fallback, '68', scale, answer='6B') is None and len(reader.templates) == 0
+
+
+def check_distance(scale):
+    fallback = Fallback()
+    reader = DigitReader(fallback=fallback, max_distance=0.1)
+    read(reader, fallback, '8', scale)
+    image = render('8', scale)
+    # one dot of the middle bar missing, as if rendered differently
+    image[3 * scale:4 * scale, 2 * scale:3 * scale] = 0
+    assert reader.read(image) == 8 and fallback.calls == 1
+
+
+def main():
+    args = parser.parse_args()
+    for check in [check_learning, check_touching, check_fallback, check_distance]:
+        check(args.scale)
+        print '{} OK'.format(check.__name__)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from chainer import Variable
+from net import Q
+from inference import QInference
+
+parser = argparse.ArgumentParser(description='Parity and latency of NumPy inference against Q')
+parser.add_argument('--width', default=150, type=int,
+                    help='width of input')
+parser.add_argument('--latent_size', default=256, type=int,
+                    help='number of units of LSTM')
+parser.add_argument('--batch', '-b', default=1, type=int,
+                    help='batch size, e.g. number of actors')
+parser.add_argument('--steps', default=5, type=int,
+                    help='number of consecutive inputs compared, carrying LSTM state')
+parser.add_argument('--repeat', '-n', default=50, type=int,
+                    help='number of calls timed')
+parser.add_argument('--seed', default=0, type=int,
+                    help='random seed of weights and inputs')
+
+# maximum absolute difference of Q values by LSTM input weight type
+TOLERANCES = {'float32': 1e-5, 'float16': 1e-3, 'int8': 1e-2}
+
+
+def latency(func, repeat):
+    func()
+    start = time.time()
+    for i in range(repeat):
+        func()
+    return (time.time() - start) / repeat * 1000
+
+
+def main():
+    args = parser.parse_args()
+    np.random.seed(args.seed)
+    height = args.width * 3 // 4
+    q = Q(width=args.width, height=height, latent_size=args.latent_size, action_size=68)
+    inputs = np.random.uniform(-1, 1, (args.steps, args.batch, 3, height, args.width)).astype(np.float32)
+    failed = False
+    for dtype in sorted(TOLERANCES):
+        engine = QInference(q, batch_size=args.batch, lstm_dtype=dtype)
+        q.reset_state()
+        error = 0
+        for step, x in enumerate(inputs):
+            if step == args.steps // 2:
+                # rows reset in the middle of a sequence, as games ending an episode
+                q.reset_state([0])
+                engine.reset_state([0])
+            expected = q(Variable(x, volatile=True), train=False).data
+            error = max(error, float(np.abs(engine(x) - expected).max()))
+        ok = error <= TOLERANCES[dtype]
+        failed = failed or not ok
+        print '{:<8} max error {:.2e} (tolerance {:.0e}) {}'.format(dtype, error, TOLERANCES[dtype], 'OK' if ok else 'FAILED')
+
+    x = inputs[0]
+    q.reset_state()
+    chainer_ms = latency(lambda: q(Variable(x, volatile=True), train=False), args.repeat)
+    print '{:<8} {:.3f}ms'.format('chainer', chainer_ms)
+    for dtype in sorted(TOLERANCES):
+        engine = QInference(q, batch_size=args.batch, lstm_dtype=dtype)
+        engine_ms = latency(lambda: engine(x), args.repeat)
+        print '{:<8} {:.3f}ms {:.2f}x'.format(dtype, engine_ms, chainer_ms / engine_ms)
+    if failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
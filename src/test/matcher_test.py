@@ -0,0 +1,78 @@
+import argparse
+import glob
+import os
+import sys
+import time
+import pyautogui as ag
+from PIL import Image, ImageOps
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import matcher
+
+parser = argparse.ArgumentParser(description='Parity test of matcher against pyautogui.locate on saved screenshots')
+parser.add_argument('--screens', '-s', required=True, type=str,
+                    help='directory of saved game screenshots (png)')
+parser.add_argument('--game', default='homerun', type=str,
+                    help='game. homerun or coingetter')
+
+# (template, x, y, w, h, blackwhite) checked by game.py
+CHECKS = {
+    'homerun': [('start', 270, 240, 60, 40, -1), ('select_title', 10, 16, 60, 40, -1),
+                ('select', 460, 406, 60, 40, -1), ('end', 278, 208, 28, 20, -1),
+                ('homerun', 284, 187, 28, 20, -1), ('hit', 284, 201, 28, 20, -1),
+                ('foul', 284, 207, 28, 20, -1), ('strike', 284, 187, 28, 20, -1)] +
+               [('stage', 70 + i % 4 * 130, 180 + i // 4 * 170, 80, 20, -1) for i in range(8)],
+    'coingetter': [('start', 213, 382, 138, 44, 100), ('restart', 263, 255, 128, 44, 100),
+                   ('restart', 263, 255, 128, 44, -1), ('left_top', 0, 0, 100, 100, -1),
+                   ('coin', 144, 415, 152, 27, -1), ('to_title', 167, 255, 128, 44, 100),
+                   ('level', 0, 0, None, None, -1)],
+}
+IMAGE_DIRS = {'homerun': 'image', 'coingetter': 'image_coingetter'}
+
+
+def locate_pyautogui(screen, image, blackwhite):
+    if blackwhite >= 0:
+        screen = ImageOps.grayscale(screen).point(lambda x: 0 if x < blackwhite else 255)
+        image = ImageOps.grayscale(image).point(lambda x: 0 if x < blackwhite else 255)
+    position = ag.locate(image, screen)
+    return None if position is None else tuple(position[:2])
+
+
+def locate_matcher(screen, image, blackwhite):
+    if blackwhite >= 0:
+        screen = matcher.binarize(screen, blackwhite)
+        image = matcher.binarize(image, blackwhite)
+    position = matcher.locate(screen, image)
+    return None if position is None else tuple(position[:2])
+
+
+def main():
+    args = parser.parse_args()
+    image_dir = os.path.join(os.path.dirname(__file__), '..', '..', IMAGE_DIRS[args.game])
+    mismatch = 0
+    total = 0
+    elapsed = [0.0, 0.0]
+    for path in sorted(glob.glob(os.path.join(args.screens, '*.png'))):
+        screen = Image.open(path).convert('RGB')
+        for name, x, y, w, h, blackwhite in CHECKS[args.game]:
+            image = Image.open(os.path.join(image_dir, '{}.png'.format(name)))
+            right = screen.width if w is None else x + w
+            bottom = screen.height if h is None else y + h
+            cropped = screen.crop((x, y, right, bottom))
+            start = time.time()
+            expected = locate_pyautogui(cropped, image, blackwhite)
+            elapsed[0] += time.time() - start
+            start = time.time()
+            actual = locate_matcher(cropped, image, blackwhite)
+            elapsed[1] += time.time() - start
+            total += 1
+            if expected != actual:
+                mismatch += 1
+                print '{} {} ({}, {}): pyautogui={} matcher={}'.format(os.path.basename(path), name, x, y, expected, actual)
+    print 'checks: {}, mismatches: {}'.format(total, mismatch)
+    print 'pyautogui: {:.3f}s, matcher: {:.3f}s'.format(elapsed[0], elapsed[1])
+    if mismatch > 0:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+import argparse
+import glob
+import os
+import sys
+import time
+import numpy as np
+from PIL import Image
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from preprocess import Preprocessor
+
+parser = argparse.ArgumentParser(description='Benchmark of capture preprocessing on recorded frames')
+parser.add_argument('--frames', '-f', required=True, type=str,
+                    help='directory of recorded game frames (png)')
+parser.add_argument('--repeat', '-n', default=10, type=int,
+                    help='number of passes over the frames')
+
+
+def preprocess_pil(bits, w, h, train_width, train_height):
+    screen = Image.fromarray(np.array(bits).reshape((h, w, 4))[:,:,2::-1])
+    train_image = np.asarray(screen.resize((train_width, train_height))).astype(np.float32).transpose((2, 0, 1))
+    return train_image.reshape((1,) + train_image.shape) / 127.5 - 1
+
+
+def preprocess_numpy(preprocessor, bits):
+    screen = preprocessor.screen(bits)
+    preprocessor.observe(screen)
+    return preprocessor.normalize()
+
+
+def main():
+    args = parser.parse_args()
+    frames = []
+    for path in sorted(glob.glob(os.path.join(args.frames, '*.png'))):
+        rgb = np.asarray(Image.open(path).convert('RGB'))
+        bgra = np.empty(rgb.shape[:2] + (4,), dtype=np.uint8)
+        bgra[:, :, 2::-1] = rgb
+        bgra[:, :, 3] = 255
+        frames.append(bytearray(bgra.tobytes()))
+    if len(frames) == 0:
+        print 'no frames in {}'.format(args.frames)
+        sys.exit(1)
+    h, w = rgb.shape[:2]
+    preprocessor = Preprocessor(w, h)
+    train_width, train_height = preprocessor.train_width, preprocessor.train_height
+
+    start = time.time()
+    for i in range(args.repeat):
+        for bits in frames:
+            preprocess_pil(bits, w, h, train_width, train_height)
+    pil_time = (time.time() - start) / (args.repeat * len(frames))
+    start = time.time()
+    for i in range(args.repeat):
+        for bits in frames:
+            preprocess_numpy(preprocessor, bits)
+    numpy_time = (time.time() - start) / (args.repeat * len(frames))
+
+    diff = np.abs(preprocess_pil(frames[0], w, h, train_width, train_height) - preprocess_numpy(preprocessor, frames[0]))
+    print 'frames: {} ({}x{})'.format(len(frames), w, h)
+    print 'pil: {:.3f}ms/frame, numpy: {:.3f}ms/frame'.format(pil_time * 1000, numpy_time * 1000)
+    print 'mean abs difference of observation: {:.4f}'.format(float(diff.mean()))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+import argparse
+import os
+import sys
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from replay import ReplayMemory, PrioritizedReplayMemory, discounted_returns
+
+parser = argparse.ArgumentParser(description='Checks of index arithmetic of the replay memory')
+parser.add_argument('--gamma', default=0.9, type=float,
+                    help='discount rate')
+
+
+def play(memory, lane, rewards, terminals):
+    # writes frames one by one as the actor does: the reward and terminal of a frame
+    # are written together with the next frame
+    for reward, terminal in zip(rewards, terminals):
+        index = memory.slot(lane)
+        prev = memory.advance(index, -1)
+        if memory.counts[lane] > 0:
+            memory.rewards[prev] = reward
+            memory.terminals[prev] = terminal
+        memory.commit(lane)
+
+
+def check_n_step_after_wrap(gamma):
+    memory = ReplayMemory(8, (1, 2, 2))
+    # 11 frames in a lane of 8; rewards of the previous lap stay in slots not rewritten yet
+    memory.rewards[:] = 1000
+    memory.terminals[:] = 1
+    play(memory, 0, [0] + [1] * 10, [0] * 9 + [1, 0])
+    # frame 2 of the previous lap ended an episode
+    memory.terminals[2] = 1
+    assert memory.slot(0) == 3
+    # frame 9 at slot 1: its transition is written, the one of frame 10 at slot 2 is not
+    returns, discount, valid = memory.n_step_returns(np.array([1]), 3, gamma)
+    assert not valid[0], 'step reaching the stale terminal of the previous lap must be invalid'
+    # frame 8 at slot 0 ends the episode: a 1-step return of it is complete
+    returns, discount, valid = memory.n_step_returns(np.array([7, 0]), 3, gamma)
+    assert valid.all()
+    assert np.allclose(returns, [1 + gamma, 1]) and np.allclose(discount, 0)
+    # frame 5 at slot 5: 3 transitions and the frame after them are written
+    returns, discount, valid = memory.n_step_returns(np.array([5]), 3, gamma)
+    assert valid[0] and np.allclose(returns, 1 + gamma + gamma ** 2)
+    assert np.allclose(discount, gamma ** 3)
+    # frame 6 at slot 6: the third transition ends the episode
+    returns, discount, valid = memory.n_step_returns(np.array([6]), 3, gamma)
+    assert valid[0] and np.allclose(discount, 0)
+
+
+def check_prioritized_head(gamma):
+    term_size = 2
+    memory = PrioritizedReplayMemory(16, (1, 2, 2), lanes=2)
+    play(memory, 0, [1] * 5, [0] * 5)
+    play(memory, 1, [1] * 20, [0] * 20)
+    # priorities on every slot, including unwritten ones and the ones at the heads
+    memory.tree.update(np.arange(16), 1.0)
+    for i in range(100):
+        index = memory.sample(8, term_size)
+        assert index is not None
+        lane = index // memory.lane_size
+        offset = index % memory.lane_size
+        # lane 0 has frames 0..4 with head 5; lane 1 has wrapped with head 4
+        assert np.all(np.where(lane == 0, offset < 5 - term_size, (4 - offset) % 8 > term_size))
+    # nothing complete: no sample rather than an incomplete one
+    memory = PrioritizedReplayMemory(8, (1, 2, 2))
+    play(memory, 0, [1] * 2, [0] * 2)
+    memory.tree.update(np.arange(8), 1.0)
+    assert memory.sample(4, term_size) is None
+
+
+def check_uniform_head(gamma):
+    term_size = 2
+    memory = ReplayMemory(16, (1, 1, 1), lanes=2)
+    play(memory, 0, [1] * 5, [0] * 5)
+    play(memory, 1, [1] * 20, [0] * 20)
+    for i in range(100):
+        index = memory.sample_uniform(8, term_size)
+        assert len(np.unique(index)) == len(index)
+        assert memory.complete(index, term_size).all()
+    # all complete transitions: frames 0..2 of lane 0, and frames 13..17 of lane 1 whose
+    # head 4 holds frame 12, to be overwritten next
+    index = memory.sample_uniform(16, term_size)
+    assert sorted(index) == [0, 1, 2, 8, 9, 13, 14, 15]
+
+
+def check_discounted_returns(gamma):
+    rewards = np.random.uniform(-1, 1, 3000)
+    # small gammas underflow in chunks of the default length
+    for g in [gamma, 0.99, 0.3, 1e-3, 0, 1]:
+        expected = np.empty(len(rewards))
+        carry = 0.0
+        for i in range(len(rewards) - 1, -1, -1):
+            carry = rewards[i] + g * carry
+            expected[i] = carry
+        assert np.allclose(discounted_returns(rewards, g), expected), g
+
+
+def main():
+    args = parser.parse_args()
+    np.random.seed(0)
+    for check in [check_n_step_after_wrap, check_prioritized_head, check_uniform_head,
+                  check_discounted_returns]:
+        check(args.gamma)
+        print '{} OK'.format(check.__name__)
+
+if __name__ == '__main__':
+    main()
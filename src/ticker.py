@@ -0,0 +1,96 @@
+import ctypes
+import ctypes.util
+import logging
+import time
+
+
+class timespec(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+CLOCK_MONOTONIC = 1
+
+
+def _load_monotonic():
+    # time.monotonic is not in Python 2; use clock_gettime where available
+    if hasattr(time, 'monotonic'):
+        return time.monotonic
+    try:
+        librt = ctypes.CDLL(ctypes.util.find_library('rt') or 'librt.so.1', use_errno=True)
+        clock_gettime = librt.clock_gettime
+    except (OSError, AttributeError):
+        return time.time
+    clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+    spec = timespec()
+
+    def monotonic():
+        if clock_gettime(CLOCK_MONOTONIC, ctypes.byref(spec)) != 0:
+            raise OSError(ctypes.get_errno(), 'clock_gettime failed')
+        return spec.tv_sec + spec.tv_nsec * 1e-9
+    return monotonic
+
+monotonic = _load_monotonic()
+
+
+class TickScheduler(object):
+    # paces a loop to ticks at start + n * interval on a monotonic clock, so that
+    # errors of sleeping do not accumulate. When a tick overruns its deadline,
+    # policy 'skip' drops the ticks already missed and stays on the grid, and
+    # 'catchup' runs them back to back, up to max_behind ticks.
+    # Lateness is how long after its deadline a tick starts.
+    SKIP = 'skip'
+    CATCHUP = 'catchup'
+
+    def __init__(self, interval, policy=SKIP, max_behind=4, metrics=None):
+        if policy not in (self.SKIP, self.CATCHUP):
+            raise ValueError('unknown tick policy: {}'.format(policy))
+        self.interval = interval
+        self.policy = policy
+        self.max_behind = max_behind
+        self.metrics = metrics
+        self.start = monotonic()
+        self.tick = 0
+        self.ticks = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.total_lateness = 0.0
+        self.max_lateness = 0.0
+
+    def deadline(self, tick=None):
+        return self.start + (self.tick if tick is None else tick) * self.interval
+
+    def wait(self):
+        # called at the end of every tick; returns when the next tick is due
+        self.ticks += 1
+        if self.interval <= 0:
+            return
+        now = monotonic()
+        next_tick = self.tick + 1
+        if now > self.deadline(next_tick):
+            self.overruns += 1
+            if self.metrics is not None:
+                self.metrics.count('overruns')
+            behind = int((now - self.start) / self.interval) - self.tick
+            if self.policy == self.SKIP or behind > self.max_behind:
+                next_tick = int((now - self.start) / self.interval) + 1
+                self.skipped += next_tick - self.tick - 1
+                if self.metrics is not None:
+                    self.metrics.count('skipped', next_tick - self.tick - 1)
+        self.tick = next_tick
+        deadline = self.deadline()
+        if deadline > now:
+            time.sleep(deadline - now)
+            now = monotonic()
+        lateness = max(now - deadline, 0.0)
+        self.total_lateness += lateness
+        self.max_lateness = max(self.max_lateness, lateness)
+        if self.metrics is not None:
+            self.metrics.record('lateness', lateness)
+
+    def summary(self):
+        mean = self.total_lateness / self.ticks if self.ticks > 0 else 0
+        return 'ticks: {} ticks, {} overruns, {} skipped, lateness mean {:.2f}ms, max {:.2f}ms'.format(
+            self.ticks, self.overruns, self.skipped, mean * 1000, self.max_lateness * 1000)
+
+    def log_summary(self, every=1000):
+        if self.ticks % every == 0:
+            logging.info(self.summary())
@@ -1,24 +1,36 @@
 import logging
 
 import argparse
+import os
 import time
-import thread
+import threading
+import multiprocessing
 import random
+import signal
 import numpy as np
-import pyautogui as ag
-from game import PoohHomerun, CoinGetter
+from game import PoohHomerun, CoinGetter, ag
+from simulator import SimulatedGame
+from screen_source import DesktopSource, SimulatedSource
+from input_backend import DesktopInput, RecordingInput
 from net import Q
+from inference import QInference
+from replay import ReplayMemory, PrioritizedReplayMemory
+from preprocess import Preprocessor
+from prefetch import BatchPrefetcher
+from checkpoint import Checkpointer
+from sync import ParameterSync, SharedParameters
+from scheduler import LearnerScheduler
+from metrics import Metrics
+from ticker import TickScheduler
 import chainer
 from chainer import functions as F
 from chainer import cuda, Variable, optimizers, serializers
-import sys
-from PyQt4.QtGui import QPixmap, QApplication
-from PIL import Image
 
 latent_size = 256
 gamma = 0.99
 batch_size = 64
-ag.PAUSE = 0
+if ag is not None:
+    ag.PAUSE = 0
 
 parser = argparse.ArgumentParser(description='Deep Q-learning Network for game using mouse')
 parser.add_argument('--gpu', '-g', default=-1, type=int,
@@ -27,12 +39,44 @@ parser.add_argument('--input', '-i', default=None, type=str,
                     help='input model file path without extension')
 parser.add_argument('--output', '-o', required=True, type=str,
                     help='output model file path without extension')
+parser.add_argument('--save_interval', default=10000, type=int,
+                    help='number of frames between saving models')
+parser.add_argument('--keep_last', default=0, type=int,
+                    help='number of latest saved models to keep (0 keeps all)')
+parser.add_argument('--keep_best', default=0, type=int,
+                    help='number of saved models with the best average reward to keep in addition to --keep_last')
 parser.add_argument('--interval', default=100, type=int,
                     help='interval of capturing (ms)')
+parser.add_argument('--tick_policy', default='skip', choices=['skip', 'catchup'],
+                    help='handling of capturing late: skip (drop missed ticks) or catchup (run them at once)')
+parser.add_argument('--action_repeat', default=1, type=int,
+                    help='number of ticks to hold an action for; only the last frame is evaluated and stored')
 parser.add_argument('--random', '-r', default=0.2, type=float,
                     help='randomness of play')
+parser.add_argument('--grayscale', action='store_true',
+                    help='observe the game screen in grayscale')
+parser.add_argument('--divisor', default=4, type=int,
+                    help='ratio of game screen size to observation size')
+parser.add_argument('--stack', default=1, type=int,
+                    help='number of last frames stacked as input of Q function')
 parser.add_argument('--pool_size', default=50000, type=int,
                     help='number of frames of memory pool size')
+parser.add_argument('--pool_file', default=None, type=str,
+                    help='file path to back the memory pool with a memory-mapped file')
+parser.add_argument('--prioritized', action='store_true',
+                    help='sample memory pool by TD error (prioritized experience replay)')
+parser.add_argument('--priority_alpha', default=0.6, type=float,
+                    help='exponent of TD error for priority of prioritized experience replay')
+parser.add_argument('--priority_beta', default=0.4, type=float,
+                    help='exponent of importance-sampling weights of prioritized experience replay')
+parser.add_argument('--learner_process', action='store_true',
+                    help='run training in a separate process with memory pool in shared memory (CPU only)')
+parser.add_argument('--weight_sync_interval', default=1000, type=int,
+                    help='number of updates between passing weights from learner process to actor')
+parser.add_argument('--replay_ratio', default=0, type=float,
+                    help='target number of training updates per collected frame (0 for no limit)')
+parser.add_argument('--prefetch', default=8, type=int,
+                    help='number of minibatch steps prepared ahead on a background thread (0 to disable)')
 parser.add_argument('--random_reduction', default=0.000002, type=float,
                     help='reduction rate of randomness')
 parser.add_argument('--min_random', default=0.1, type=float,
@@ -43,14 +87,40 @@ parser.add_argument('--train_term_increase', default=0.00002, type=float,
                     help='increase rate of training term size')
 parser.add_argument('--max_train_term', default=32, type=int,
                     help='maximum training term size')
+parser.add_argument('--bptt', action='store_true',
+                    help='train LSTM by truncated BPTT over a sampled window with one update per window')
+parser.add_argument('--n_step', default=1, type=int,
+                    help='number of rewards summed before bootstrapping from Q function (requires --bptt)')
 parser.add_argument('--double_dqn', action='store_true',
                     help='use Double DQN algorithm')
 parser.add_argument('--update_target_interval', default=2000, type=int,
                     help='interval to update target Q function of Double DQN')
+parser.add_argument('--target_tau', default=1.0, type=float,
+                    help='rate of Polyak averaging when updating target Q function of Double DQN (1 copies)')
+parser.add_argument('--actor_sync_interval', default=0, type=int,
+                    help='number of frames between updating Q function for playing (0 updates at every terminal)')
+parser.add_argument('--inference', default='chainer', choices=['chainer', 'float32', 'float16', 'int8'],
+                    help='Q function for playing: chainer, or NumPy with LSTM input weights rounded to the given type')
 parser.add_argument('--only_result', action='store_true',
                     help='use only reward to evaluate')
 parser.add_argument('--game', default='homerun', type=str,
                     help='game. homerun or coingetter')
+parser.add_argument('--actors', default=1, type=int,
+                    help='number of games played in parallel (requires --simulate)')
+parser.add_argument('--simulate', action='store_true',
+                    help='play a synthetic game without desktop at full speed')
+parser.add_argument('--max_frames', default=0, type=int,
+                    help='number of frames to play before reporting throughput and exiting (0 for no limit)')
+parser.add_argument('--seed', default=None, type=int,
+                    help='random seed')
+parser.add_argument('--detect_factor', default=4, type=int,
+                    help='downsampling factor of coarse search for game screen position (1 for full search)')
+parser.add_argument('--position_file', default=None, type=str,
+                    help='file to remember game screen position, which is tried first on the next start')
+parser.add_argument('--metrics_interval', default=0, type=float,
+                    help='seconds between summaries of stage timings of playing and training (0 to disable)')
+parser.add_argument('--metrics_file', default=None, type=str,
+                    help='file to append the summaries to as JSON lines')
 parser.add_argument('--log', default=20, type=int,
                     help='20 or 10')
 args = parser.parse_args()
@@ -58,23 +128,69 @@ args = parser.parse_args()
 logging.basicConfig(format='%(asctime)s:%(levelname)s:%(message)s',
                         level=args.log)
 
-interval = args.interval / 1000.0
+interval = 0 if args.simulate else args.interval / 1000.0
 only_result = args.only_result
 use_double_dqn = args.double_dqn
 update_target_interval = args.update_target_interval
-game = CoinGetter() if args.game == 'coingetter' else PoohHomerun()
-game.load_images('image_coingetter' if args.game == 'coingetter' else 'image')
-if game.detect_position() is None:
-    logging.critical("Error: cannot detect game screen position.")
+learner_process = args.learner_process
+if learner_process and args.gpu >= 0:
+    logging.critical("Error: --learner_process supports only CPU.")
     exit()
+if args.n_step > 1 and not args.bptt:
+    logging.critical("Error: --n_step requires --bptt.")
+    exit()
+if args.actors > 1 and not args.simulate:
+    # games on one desktop share the mouse cursor and the keyboard focus, so the action
+    # of one game would be overridden by the next and stored in replay as if applied
+    logging.critical("Error: --actors requires --simulate.")
+    exit()
+if args.divisor < 1:
+    logging.critical("Error: --divisor must be 1 or more.")
+    exit()
+if args.stack < 1:
+    logging.critical("Error: --stack must be 1 or more.")
+    exit()
+# events of all games, sent once per tick
+input_backend = RecordingInput(batch=True, limit=0) if args.simulate else DesktopInput(batch=True)
+def create_game(index=0):
+    if args.simulate:
+        game = SimulatedGame(seed=None if args.seed is None else args.seed + index)
+    else:
+        game = CoinGetter() if args.game == 'coingetter' else PoohHomerun()
+        game.load_images('image_coingetter' if args.game == 'coingetter' else 'image')
+    game.input_backend = input_backend
+    return game
+
+game = create_game()
+if args.simulate:
+    games = [game] + [create_game(i) for i in range(1, args.actors)]
+else:
+    hint = None
+    if args.position_file is not None and os.path.exists(args.position_file):
+        with open(args.position_file) as f:
+            hint = tuple(int(v) for v in f.read().split()[:2])
+    if game.detect_position(factor=args.detect_factor, hint=hint) is None:
+        logging.critical("Error: cannot detect game screen position.")
+        exit()
+    if args.position_file is not None:
+        with open(args.position_file, 'w') as f:
+            f.write('{} {}\n'.format(game.x, game.y))
+    games = [game]
 left, top, w, h = game.region()
-train_width = w / 4
-train_height = h / 4
-random.seed()
+preprocessors = [Preprocessor(w, h, divisor=args.divisor, grayscale=args.grayscale) for g in games]
+preprocessor = preprocessors[0]
+train_width = preprocessor.train_width
+train_height = preprocessor.train_height
+channels = preprocessor.channels
+stack = args.stack
+random.seed(args.seed)
+if args.seed is not None:
+    np.random.seed(args.seed)
 
 gpu_device = None
 xp = np
-q = Q(width=train_width, height=train_height, latent_size=latent_size, action_size=game.action_size())
+q = Q(width=train_width, height=train_height, channel=channels * stack, latent_size=latent_size,
+      action_size=game.action_size())
 target_q = None
 if args.gpu >= 0:
     cuda.check_cuda_available()
@@ -84,21 +200,29 @@ if args.gpu >= 0:
     q.to_gpu()
 
 POOL_SIZE = args.pool_size
-state_pool = np.zeros((POOL_SIZE, 3, train_height, train_width), dtype=np.float32)
-action_pool = np.zeros((POOL_SIZE,), dtype=np.int32)
-reward_pool = np.zeros((POOL_SIZE,), dtype=np.float32)
-terminal_pool = np.zeros((POOL_SIZE,), dtype=np.float32)
+prioritized = args.prioritized
+if prioritized:
+    memory = PrioritizedReplayMemory(POOL_SIZE, (channels, train_height, train_width), filename=args.pool_file,
+                                     shared=learner_process, lanes=len(games), stack=stack,
+                                     alpha=args.priority_alpha)
+else:
+    memory = ReplayMemory(POOL_SIZE, (channels, train_height, train_width), filename=args.pool_file,
+                          shared=learner_process, lanes=len(games), stack=stack)
+state_pool = memory.states
+action_pool = memory.actions
+reward_pool = memory.rewards
+terminal_pool = memory.terminals
 
 # allocate memory
-state_pool[...] = 0
+if args.pool_file is None:
+    state_pool[...] = 0
 action_pool[...] = 0
 reward_pool[...] = 0
 terminal_pool[...] = 0
-
-if only_result:
-    terminal_pool[-1] = 1
 frame = 0
 average_reward = 0
+# average reward seen by the learner process for choosing the best models
+average_reward_value = multiprocessing.RawValue('d', 0.0)
 
 optimizer = optimizers.AdaDelta(rho=0.95, eps=1e-06)
 optimizer.setup(q)
@@ -107,135 +231,397 @@ if args.input is not None:
     serializers.load_hdf5('{}.model'.format(args.input), q)
     serializers.load_hdf5('{}.state'.format(args.input), optimizer)
 
+# held by the learner while updating parameters so that checkpoints are consistent
+update_lock = threading.Lock()
+checkpointer = Checkpointer(args.output, keep_last=args.keep_last, keep_best=args.keep_best, lock=update_lock)
+# weights published by the learner process for the actor
+shared_params = SharedParameters(q) if learner_process else None
+learner_save_frame = args.save_interval
+learner_save_count = 0
+# persistent replicas of q for playing and for the target of Double DQN
+action_sync = ParameterSync(q, lock=update_lock, name='actor sync', shared=shared_params)
+target_sync = ParameterSync(q, tau=args.target_tau, name='target sync') if use_double_dqn else None
+
 random_probability = args.random
 random_reduction_rate = 1 - args.random_reduction
 min_random_probability = min(random_probability, args.min_random)
 
-app = QApplication(sys.argv)
-window_id = app.desktop().winId()
+source = SimulatedSource() if args.simulate else DesktopSource()
 
-def train():
+scheduler = LearnerScheduler(replay_ratio=args.replay_ratio, shared=learner_process)
+actor_metrics = Metrics('actor', args.metrics_interval, args.metrics_file)
+learner_metrics = Metrics('learner', args.metrics_interval, args.metrics_file)
+
+def sample_batch(term_size, updates=None):
+    # blocks until enough frames are collected and the replay ratio allows the updates
+    # done with the batch: one per step (train), or one per window (train_window).
+    # The updates are reserved only if a batch is drawn. None if not ready or stopped.
+    if updates is None:
+        updates = term_size
+    if not scheduler.wait(batch_size * term_size, updates):
+        return None
+    if prioritized:
+        batch_index = memory.sample(batch_size, term_size)
+        if batch_index is None:
+            return None
+    else:
+        batch_index = memory.sample_uniform(batch_size, term_size)
+    scheduler.reserve(updates)
+    scheduler.log_summary()
+    return batch_index
+
+def after_update(updates):
+    # in the learner process: passes weights to the actor and saves models
+    global learner_save_frame, learner_save_count
+    if not learner_process:
+        return
+    if updates % args.weight_sync_interval == 0:
+        shared_params.publish(q)
+    if scheduler.frames >= learner_save_frame:
+        logging.info('save: {}'.format(learner_save_count))
+        checkpointer.save(learner_save_count, q, optimizer, score=average_reward_value.value)
+        learner_save_frame += args.save_interval
+        learner_save_count += 1
+
+actor_version = None
+def sync_actor(player):
+    # copies the learner's weights to the Q function for playing and to player,
+    # unless the learner has not updated them since the last copy
+    global actor_version
+    version = shared_params.version.value if learner_process else optimizer.t
+    if version == actor_version:
+        return
+    actor_version = version
+    action_sync.sync()
+    action_sync.log_summary()
+    if player is not action_sync.replica:
+        player.load(action_sync.replica)
+
+def best_value(score, target_score=None):
+    # value of the next state; with target_score, of the target at the best action of score (Double DQN)
+    if target_score is not None:
+        best_action = cuda.to_cpu(xp.argmax(score.data, axis=1))
+        return cuda.to_cpu(target_score.data)[range(len(best_action)), best_action]
+    return cuda.to_cpu(xp.max(score.data, axis=1))
+
+def target_value(batch_index, score, next_states, target_q=None):
+    if only_result:
+        return xp.asarray(reward_pool[batch_index])
+    target_score = None
+    if target_q is not None:
+        target_score = target_q(Variable(next_states, volatile=True))
+    best_q = best_value(score, target_score)
+    return xp.asarray(reward_pool[batch_index] + (1 - terminal_pool[batch_index]) * gamma * best_q)
+
+def train_window():
     max_term_size = args.max_train_term
     current_term_size = args.train_term
     term_increase_rate = 1 + args.train_term_increase
-    last_clock = time.clock()
     update_target_iteration = 0
-    if use_double_dqn:
-        target_q = q.copy()
-        target_q.reset_state()
+    updates = 0
+    target_q = target_sync.replica if use_double_dqn else None
     while True:
         term_size = int(current_term_size)
-        if frame < batch_size * term_size:
+        with learner_metrics.timer('wait'):
+            batch_index = sample_batch(term_size, 1)
+        if batch_index is None:
+            if scheduler.stopped:
+                return
+            time.sleep(0.01)
+            continue
+        with learner_metrics.timer('gather'):
+            frames, index, mask = memory.get_windows(batch_index, term_size)
+        if not only_result:
+            # step term bootstraps from step term + n, n steps ahead at most to the end of the window
+            n_steps = [min(args.n_step, term_size - term) for term in range(term_size)]
+            targets = [memory.n_step_returns(index[:, term], n, gamma) for term, n in enumerate(n_steps)]
+            mask *= np.array([valid for returns, discount, valid in targets], dtype=np.float32).T
+        count = float(mask.sum())
+        if prioritized:
+            mask *= memory.weights(batch_index, args.priority_beta, min(scheduler.frames, POOL_SIZE))[:, None]
+        if count == 0:
             continue
-        batch_index = np.random.permutation(min(frame - term_size, POOL_SIZE))[:batch_size]
-        train_image = Variable(xp.asarray(state_pool[batch_index]))
-        y = q(train_image)
         if use_double_dqn and update_target_iteration >= update_target_interval:
-            target_q = q.copy()
-            target_q.reset_state()
-            target_q(Variable(xp.asarray(state_pool[batch_index]), volatile=True))
-            update_iteration = 0
-        for term in range(term_size):
-            next_batch_index = (batch_index + 1) % POOL_SIZE
-            train_image = Variable(xp.asarray(state_pool[next_batch_index]))
-            score = q(train_image)
-            if only_result:
-                t = Variable(xp.asarray(reward_pool[batch_index]))
-            else:
+            target_sync.sync()
+            target_sync.log_summary()
+            update_target_iteration = 0
+        with learner_metrics.timer('forward'):
+            q.reset_state()
+            if use_double_dqn:
+                target_q.reset_state()
+            scores = []
+            target_scores = []
+            for term in range(term_size + 1):
+                train_image = Variable(xp.asarray(memory.normalize(frames[:, term])))
+                scores.append(q(train_image))
                 if use_double_dqn:
-                    eval_image = Variable(xp.asarray(state_pool[next_batch_index]), volatile=True)
-                    target_score = target_q(eval_image)
-                    best_action = cuda.to_cpu(xp.argmax(score.data, axis=1))
-                    best_q = cuda.to_cpu(target_score.data)[range(batch_size), best_action]
+                    target_scores.append(target_q(Variable(train_image.data, volatile=True)))
+            loss = 0
+            for term in range(term_size):
+                step_index = index[:, term]
+                if only_result:
+                    t = reward_pool[step_index]
                 else:
-                    best_q = cuda.to_cpu(xp.max(score.data, axis=1))
-                t = Variable(xp.asarray(reward_pool[batch_index] + (1 - terminal_pool[batch_index]) * gamma * best_q))
-            action_index = chainer.Variable(xp.asarray(action_pool[batch_index]))
-            loss = F.mean_squared_error(F.select_item(y, action_index), t)
-            y = score
+                    n = n_steps[term]
+                    returns, discount, valid = targets[term]
+                    t = returns + discount * best_value(scores[term + n],
+                                                        target_scores[term + n] if use_double_dqn else None)
+                action_index = Variable(xp.asarray(action_pool[step_index]))
+                error = F.select_item(scores[term], action_index) - Variable(xp.asarray(t))
+                loss += F.sum(error * error * xp.asarray(mask[:, term]))
+                if prioritized and term == 0:
+                    # only the sampled transitions, the starts of the windows, were drawn by priority
+                    valid = mask[:, term] > 0
+                    memory.update_priorities(step_index[valid], cuda.to_cpu(error.data)[valid])
+            loss /= count
+        with learner_metrics.timer('backward'):
             optimizer.zero_grads()
             loss.backward()
             loss.unchain_backward()
+        with learner_metrics.timer('update'), update_lock:
             optimizer.update()
+        updates += 1
+        learner_metrics.count('updates')
+        learner_metrics.report()
+        after_update(updates)
+        if use_double_dqn:
+            update_target_iteration += term_size
+        current_term_size = min(current_term_size * term_increase_rate, max_term_size)
+
+def train():
+    max_term_size = args.max_train_term
+    current_term_size = args.train_term
+    term_increase_rate = 1 + args.train_term_increase
+    update_target_iteration = 0
+    updates = 0
+    target_q = None
+    if use_double_dqn:
+        target_q = target_sync.replica
+        target_q.reset_state()
+    prefetcher = BatchPrefetcher(memory, sample_batch, batch_size, capacity=args.prefetch,
+                                 stopped=lambda: scheduler.stopped)
+    prefetcher.term_size = int(current_term_size)
+    prefetcher.start()
+    while True:
+        with learner_metrics.timer('wait'):
+            batch_index, term_size = prefetcher.get_batch()
+        if batch_index is None:
+            return
+        with learner_metrics.timer('gather'):
+            states = prefetcher.get_states()
+        with learner_metrics.timer('forward'):
+            train_image = Variable(xp.asarray(states))
+            y = q(train_image)
+        if use_double_dqn and update_target_iteration >= update_target_interval:
+            target_sync.sync()
+            target_sync.log_summary()
+            target_q.reset_state()
+            target_q(Variable(xp.asarray(states), volatile=True))
+            update_target_iteration = 0
+        for term in range(term_size):
+            next_batch_index = memory.advance(batch_index, 1)
+            with learner_metrics.timer('gather'):
+                next_states = prefetcher.get_states()
+            with learner_metrics.timer('forward'):
+                train_image = Variable(xp.asarray(next_states))
+                score = q(train_image)
+                t = Variable(target_value(batch_index, score, train_image.data, target_q))
+                action_index = chainer.Variable(xp.asarray(action_pool[batch_index]))
+                if prioritized and term == 0:
+                    # only the sampled transitions were drawn by priority; the later steps are
+                    # learned unweighted and keep their priorities
+                    weights = memory.weights(batch_index, args.priority_beta, min(scheduler.frames, POOL_SIZE))
+                    error = F.select_item(y, action_index) - t
+                    loss = F.sum(error * error * xp.asarray(weights)) / len(batch_index)
+                    memory.update_priorities(batch_index, cuda.to_cpu(error.data))
+                else:
+                    loss = F.mean_squared_error(F.select_item(y, action_index), t)
+            y = score
+            with learner_metrics.timer('backward'):
+                optimizer.zero_grads()
+                loss.backward()
+                loss.unchain_backward()
+            with learner_metrics.timer('update'), update_lock:
+                optimizer.update()
+            updates += 1
+            learner_metrics.count('updates')
+            learner_metrics.report()
+            after_update(updates)
+            prefetcher.release(states)
+            states = next_states
             batch_index = next_batch_index
-            logging.debug("loss", float(cuda.to_cpu(loss.data)))
-            clock = time.clock()
-            logging.debug("train", clock - last_clock)
-            last_clock = clock
+            if logging.getLogger().isEnabledFor(logging.DEBUG):
+                logging.debug('loss: {}'.format(float(cuda.to_cpu(loss.data))))
             if use_double_dqn:
                 update_target_iteration += 1
+        prefetcher.release(states)
         current_term_size = min(current_term_size * term_increase_rate, max_term_size)
-        logging.debug("current_term_size ", current_term_size)
+        prefetcher.term_size = int(current_term_size)
+        logging.debug('current_term_size: {}'.format(current_term_size))
+
+def learn():
+    global checkpointer
+    if learner_process:
+        # the actor stops the learner with scheduler.stop() on Ctrl-C as well
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        # threads of the actor are not inherited by the forked learner process
+        checkpointer = Checkpointer(args.output, keep_last=args.keep_last, keep_best=args.keep_best,
+                                    lock=update_lock)
+    if args.bptt:
+        train_window()
+    else:
+        train()
+    if learner_process:
+        # writes the pending checkpoints before the process exits
+        checkpointer.close()
 
 if __name__ == '__main__':
     try:
-        thread.start_new_thread(train, ())
-        next_clock = time.clock() + interval
-        save_iter = 10000
+        if learner_process:
+            learner = multiprocessing.Process(target=learn)
+        else:
+            learner = threading.Thread(target=learn)
+        learner.daemon = True
+        learner.start()
+        start_time = time.time()
+        ticker = TickScheduler(interval, policy=args.tick_policy, metrics=actor_metrics)
+        save_iter = args.save_interval
         save_count = 0
-        action = None
-        action_q = q.copy()
+        actions = [None] * len(games)
+        # ticks left to hold the action and reward summed over them, per game
+        holds = [0] * len(games)
+        reward_sums = [0] * len(games)
+        action_q = action_sync.replica
         action_q.reset_state()
+        # evaluates action_q for playing; QInference keeps its own copy of weights and LSTM state
+        player = action_q if args.inference == 'chainer' else \
+            QInference(action_q, batch_size=len(games), lstm_dtype=args.inference)
+        # observations of all games, evaluated by player in one batch
+        inputs = np.zeros((len(games),) + memory.input_shape, dtype=np.float32)
         while True:
-            if action is not None:
-                game.play(action)
-
-            pixmap = QPixmap.grabWindow(window_id, left, top, w, h)
-            image = pixmap.toImage()
-            bits = image.bits()
-            bits.setsize(image.byteCount())
-            screen = Image.fromarray(np.array(bits).reshape((h, w, 4))[:,:,2::-1])
-            reward, terminal = game.process(screen)
-            logging.debug("reward={}, terminal={}".format(reward, terminal))
-            if reward is not None:
-                train_image = xp.asarray(screen.resize((train_width, train_height))).astype(np.float32).transpose((2, 0, 1))
-                train_image = Variable(train_image.reshape((1,) + train_image.shape) / 127.5 - 1, volatile=True)
-                score = action_q(train_image, train=False)
-
-                best = int(np.argmax(score.data))
+            tick_start = time.time()
+            with actor_metrics.timer('play'):
+                for game, action in zip(games, actions):
+                    if action is not None:
+                        game.play(action)
+            with actor_metrics.timer('input'):
+                actor_metrics.count('input_events', input_backend.flush())
+
+            results = []
+            holding = []
+            for i, game in enumerate(games):
+                with actor_metrics.timer('capture'):
+                    screen = preprocessors[i].screen(source.grab(game))
+                with actor_metrics.timer('process'):
+                    reward, terminal = game.process(screen)
+                logging.debug("reward={}, terminal={}".format(reward, terminal))
+                decide = False
+                if reward is not None:
+                    reward_sums[i] += reward
+                    holds[i] -= 1
+                    # while holding an action only rewards and terminals are detected
+                    decide = actions[i] is None or terminal or holds[i] <= 0
+                    if decide:
+                        with actor_metrics.timer('preprocess'):
+                            preprocessors[i].observe(screen)
+                            # the last stack frames, the first frame repeated at the start of an episode
+                            inputs[i, :-channels] = inputs[i, channels:]
+                            preprocessors[i].normalize(out=inputs[i:i + 1, -channels:])
+                            if actions[i] is None or terminal:
+                                inputs[i] = np.tile(inputs[i, -channels:], (stack, 1, 1))
+                    else:
+                        holding.append(i)
+                else:
+                    inputs[i] = 0
+                results.append((reward, terminal, decide))
+            playing = any(decide for reward, terminal, decide in results)
+            if playing:
+                with actor_metrics.timer('inference'):
+                    # LSTM state of the games holding their actions is kept as is
+                    state = player.get_state(holding) if len(holding) > 0 else None
+                    if player is action_q:
+                        score = action_q(Variable(xp.asarray(inputs), volatile=True), train=False)
+                        scores = cuda.to_cpu(score.data)
+                    else:
+                        scores = player(inputs)
+                    if len(holding) > 0:
+                        player.set_state(holding, state)
+
+            for i, game in enumerate(games):
+                reward, terminal, decide = results[i]
+                if reward is None:
+                    actions[i] = None
+                    if playing:
+                        # the games not playing must not carry LSTM state into the next play
+                        player.reset_state([i])
+                    continue
+                if not decide:
+                    continue
+                reward = reward_sums[i]
+                reward_sums[i] = 0
+                holds[i] = args.action_repeat
+                best = int(np.argmax(scores[i]))
                 action = game.randomize_action(best, random_probability)
-                #print action, float(score.data[0][action]), best, float(score.data[0][best]), reward
-                index = frame % POOL_SIZE
-                state_pool[index] = cuda.to_cpu(train_image.data)
-                action_pool[index] = action
-                reward_pool[index - 1] = reward
+                actions[i] = action
+                #print action, float(scores[i][action]), best, float(scores[i][best]), reward
+                index = memory.slot(i)
+                prev = memory.advance(index, -1)
+                with actor_metrics.timer('replay'):
+                    memory.put_state(index, preprocessors[i].observation)
+                    action_pool[index] = action
+                    reward_pool[prev] = reward
+                    if prioritized:
+                        # the transition of prev is complete now; the one of index is not yet
+                        if memory.counts[i] > 0:
+                            memory.set_priority(prev)
+                        memory.set_priority(index, 0)
                 average_reward = average_reward * 0.9999 + reward * 0.0001
-                logging.debug("average reward: ", average_reward)
+                average_reward_value.value = average_reward
+                logging.debug('average reward: {}'.format(average_reward))
                 if terminal:
-                    terminal_pool[index - 1] = 1
-                    if only_result:
-                        i = index - 2
-                        r = reward
-                        while terminal_pool[i] == 0:
-                            r = reward_pool[i] + gamma * r
-                            reward_pool[i] = r
-                            i -= 1
-                    action_q = q.copy()
-                    action_q.reset_state()
+                    terminal_pool[prev] = 1
+                    with actor_metrics.timer('episode'):
+                        memory.end_episode(i, gamma if only_result else None)
+                    if args.actor_sync_interval <= 0:
+                        sync_actor(player)
+                    player.reset_state([i])
                 else:
-                    terminal_pool[index - 1] = 0
+                    terminal_pool[prev] = 0
+                if args.actor_sync_interval > 0 and frame % args.actor_sync_interval == 0:
+                    sync_actor(player)
+                memory.commit(i)
                 frame += 1
+                scheduler.add_frame()
+                actor_metrics.count('frames')
                 save_iter -= 1
                 random_probability *= random_reduction_rate
                 if random_probability < min_random_probability:
                     random_probability = min_random_probability
-            else:
-                action = None
-                if save_iter <= 0:
-                    logging.info('save: ', save_count)
-                    serializers.save_hdf5('{0}_{1:03d}.model'.format(args.output, save_count), q)
-                    serializers.save_hdf5('{0}_{1:03d}.state'.format(args.output, save_count), optimizer)
-                    save_iter = 10000
+            if None in actions and save_iter <= 0:
+                # the pool file is synced at the save interval in both modes
+                memory.flush()
+                if not learner_process:
+                    logging.info('save: {}'.format(save_count))
+                    checkpointer.save(save_count, q, optimizer, score=average_reward)
                     save_count += 1
-            current_clock = time.clock()
-            wait = next_clock - current_clock
-            if wait > 0:
-                next_clock += interval
-                logging.debug('wait: ', wait)
-                time.sleep(wait)
-            elif wait > -interval / 2:
-                next_clock += interval
-            else:
-                next_clock = current_clock + interval
+                save_iter = args.save_interval
+            if 0 < args.max_frames <= frame:
+                break
+            actor_metrics.record('tick', time.time() - tick_start)
+            actor_metrics.report()
+            ticker.wait()
+            ticker.log_summary()
     except KeyboardInterrupt:
         pass
+    elapsed = time.time() - start_time
+    logging.info('{} frames in {:.1f}s: {:.1f} frames/s, {:.1f} updates/s'.format(
+        frame, elapsed, frame / elapsed, scheduler.updates / elapsed))
+    logging.info(ticker.summary())
+    logging.info('input: {} events requested, {} sent'.format(input_backend.requested, input_backend.sent))
+    # the learner finishes its update and, in a process, writes its checkpoints before exiting
+    scheduler.stop()
+    learner.join(60)
+    if learner.is_alive():
+        logging.error('learner did not stop; its pending checkpoints may be lost')
+    memory.flush()
+    checkpointer.close()
@@ -0,0 +1,79 @@
+import zlib
+import numpy as np
+import matcher
+
+
+class RegionWatcher(object):
+    # tells whether fixed regions of the screen changed since the previous frame by
+    # comparing CRC32 fingerprints of their raw pixels. A region is a box (x, y, w, h),
+    # relative to the position of an anchor check of plan if anchor is given.
+    # Anchor positions are cached and only searched again when the template is no
+    # longer at the cached position. An anchor not found is searched again after
+    # retry calls.
+    def __init__(self, plan, retry=10):
+        self.plan = plan
+        self.retry = retry
+        self.regions = {}
+        self.fingerprints = {}
+        self.anchors = {}
+        self.misses = {}
+        self.searches = 0
+
+    def add(self, name, x, y, w, h, anchor=None):
+        self.regions[name] = (x, y, w, h, anchor)
+        self.fingerprints.pop(name, None)
+
+    def reset(self):
+        # forgets fingerprints, e.g. when a new game starts
+        self.fingerprints.clear()
+
+    def anchor(self, name):
+        # position of the check name of plan on its current screen, or None
+        template, x, y, right, bottom, blackwhite = self.plan.checks[name]
+        position = self.anchors.get(name)
+        if position is not None and blackwhite < 0 and matcher.match_at(self.plan.rgb, template, *position):
+            return position
+        if position is None and self.misses.get(name, 0) > 0:
+            self.misses[name] -= 1
+            return None
+        self.searches += 1
+        position = self.plan.find(name)
+        self.anchors[name] = position
+        self.misses[name] = self.retry if position is None else 0
+        return position
+
+    def fingerprint(self, name):
+        # None while the anchor of the region is not on the screen
+        x, y, w, h, anchor = self.regions[name]
+        if anchor is not None:
+            position = self.anchor(anchor)
+            if position is None:
+                return None
+            x += position[0]
+            y += position[1]
+        return zlib.crc32(self.plan.rgb[y:y + h, x:x + w].tobytes())
+
+    def changed(self, name):
+        # whether the region differs from the previous call. A region appearing or
+        # disappearing is not a change.
+        fingerprint = self.fingerprint(name)
+        previous = self.fingerprints.get(name)
+        self.fingerprints[name] = fingerprint
+        return fingerprint is not None and previous is not None and fingerprint != previous
+
+
+class ScreenChange(object):
+    # cheap signal of screen transitions: the rate of pixels on a grid of step pixels
+    # whose green value moved by more than threshold since the previous frame
+    def __init__(self, step=8, threshold=16):
+        self.step = step
+        self.threshold = threshold
+        self.previous = None
+
+    def update(self, rgb):
+        sample = rgb[::self.step, ::self.step, 1].astype(np.int16)
+        previous = self.previous
+        self.previous = sample
+        if previous is None or previous.shape != sample.shape:
+            return 1.0
+        return np.count_nonzero(np.abs(sample - previous) > self.threshold) / float(sample.size)